@@ -5,60 +5,138 @@ Author: Deckoner
 
 # Standard library imports
 import os
+import argparse
+import io
 import csv
 import re
 import json
-from concurrent.futures import ThreadPoolExecutor
+import time
+import hashlib
+import dataclasses
+import shutil
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse
 
 # Third party imports
-import requests
-import pandas as pd
-from tqdm import tqdm
-from bs4 import BeautifulSoup
-from PIL import Image
+# requests, bs4, lxml, PIL, tqdm and mysql.connector are slow to import, so
+# they are imported inside the functions that use them. A command only pays
+# for the libraries it actually needs.
 from dotenv import load_dotenv
-import mysql.connector
-from mysql.connector import Error
 
-load_dotenv()
+# Local imports
+from card_record import CARD_FIELDS, CardRecord
+from http_cache import HttpCache, atomic_write
+from metrics import metrics
+from storage import MySQLBackend, SQLiteBackend
 
+load_dotenv()
 
-def create_csv(bt_pages=None):
+# Site the cards are scraped from, only worth changing for a mirror or a benchmark
+_SITE_URL = os.getenv("DIGIMON_SITE_URL", "https://world.digimoncard.com").rstrip("/")
+
+_log = logging.getLogger("digimon")
+
+# Shared by every stage in the process, see _backend
+_storage = None
+_storage_lock = threading.Lock()
+
+# Owner of the collection and decks when no user is given
+DEFAULT_USER_ID = 1
+
+# Where fill_db records its progress so a crashed load can resume
+_FILL_CHECKPOINT = os.path.join("temp", "fill_db.checkpoint.json")
+
+# Parsed cards of every BT page, reused while the page stays the same
+_PAGE_CACHE = os.path.join("temp", "pages")
+_PAGE_MANIFEST = os.path.join(_PAGE_CACHE, "manifest.json")
+
+# What download_images' fetchers hand back when an image can't be downloaded
+_DOWNLOAD_FAILED = object()
+
+# Every image file per card, written by download_images
+_IMAGE_MANIFEST = os.path.join("img", "manifest.json")
+
+# Encoded images, one copy per distinct download
+_IMAGE_STORE = os.path.join("img", "store")
+
+# Cards columns in the order _card_values produces them
+_CARD_COLUMNS = (
+    "card_number",
+    "name",
+    "dp",
+    "card_type_id",
+    "rarity_id",
+    "color_one_id",
+    "color_two_id",
+    "color_three_id",
+    "image_url",
+    "cost",
+    "stage_id",
+    "attribute_id",
+    "type_one_id",
+    "type_two_id",
+    "evolution_cost_one",
+    "evolution_cost_two",
+    "effect",
+    "evolution_effect",
+    "security_effect",
+    "bt_id",
+    "alternative",
+    "level",
+    "content_hash",
+)
+
+
+@metrics.traced("create_csv")
+def create_csv(
+    bt_pages=None,
+    max_workers=None,
+    rate_limit=None,
+    parse_workers=None,
+    duplicates=None,
+    reparse=False,
+):
     """
     Cooks up a fresh CSV with card data from the Digimon website.
+    Pages are fetched concurrently but written in BT order, so the
+    output is the same as a one-page-at-a-time run.
+    Every page is fingerprinted in temp/pages/manifest.json next to its
+    parsed cards. A page whose body (and the parser) hasn't changed since
+    the last run isn't parsed again, its cards come from temp/pages.
 
     Args:
         bt_pages (list, optional): Specific BT sets to process.
         If not provided, grabs all available BTs from the website.
+        max_workers (int, optional): How many pages to download at once.
+        Defaults to FETCH_WORKERS from the environment.
+        rate_limit (float, optional): Max requests per second per host.
+        Defaults to FETCH_RATE_LIMIT from the environment.
+        parse_workers (int, optional): Processes used to parse pages.
+        Defaults to PARSE_WORKERS from the environment, or one per CPU.
+        duplicates (str, optional): What to do when the site lists a card
+        twice with different data: "first", "last" or "merge".
+        Defaults to CSV_DUPLICATES from the environment, or "first".
+        reparse (bool): Parse every page, even unchanged ones.
     """
+    from card_parser import parse_page
+
+    session = _create_session(max_workers)
+    cache = _create_http_cache()
+
+    if parse_workers is None:
+        parse_workers = _env_int("PARSE_WORKERS", os.cpu_count() or 1)
+
+    duplicate_filter = _DuplicateFilter(
+        duplicates or os.getenv("CSV_DUPLICATES", "first")
+    )
+
     if bt_pages is None:
-        bt_pages = _list_BTs()
-
-    headers = [
-        "card_number",
-        "name",
-        "card_type",
-        "rarity",
-        "color_one",
-        "color_two",
-        "color_three",
-        "image_url",
-        "cost",
-        "stage",
-        "attribute",
-        "type_one",
-        "type_two",
-        "evolution_cost_one",
-        "evolution_cost_two",
-        "effect",
-        "evolution_effect",
-        "security_effect",
-        "bt_abbreviation",
-        "bt_name",
-        "dp",
-        "alternative",
-        "level",
-    ]
+        bt_pages = _list_BTs(session, cache)
+
+    headers = list(CARD_FIELDS)
 
     if not os.path.exists("temp"):
         os.makedirs("temp")
@@ -72,236 +150,165 @@ def create_csv(bt_pages=None):
 
         csv_writer.writerow(headers)
 
-        for page in bt_pages:
-            url = page[0]
-            bt_name = page[1]
-            bt_abbreviation = page[2]
+        def write_card(card):
+            csv_writer.writerow(card.to_csv_row())
+            metrics.inc("cards_written_total")
+            _log.debug("Card written: %s", card.card_number)
 
-            response = requests.get(url)
+        urls = [page[0] for page in bt_pages]
+        responses = _fetch_pages(urls, session, max_workers, rate_limit, cache)
 
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, "lxml")
+        manifest = _read_page_manifest()
+        parser_version = _parser_fingerprint()
+        reused = 0
 
-                ul_element = soup.find("ul", class_="image_lists")
+        # Parsing is CPU bound, so pages are handed to worker processes as
+        # they arrive and the results are written back in BT order.
+        with _process_pool(parse_workers) as parse_pool:
+            parsed_pages = []
+            for page, response in zip(bt_pages, responses):
+                if response is None:
+                    continue
 
-                if ul_element:
-                    card_items = soup.find_all(
-                        "li", class_=re.compile(r"image_lists_item data page-\d+")
+                if response.status_code != 200:
+                    print(
+                        f"Failed to retrieve page. Status code: {response.status_code}"
                     )
+                    continue
+
+                fingerprint = {
+                    "sha256": hashlib.sha256(response.content).hexdigest(),
+                    "parser": parser_version,
+                    "site": _SITE_URL,
+                    "bt_name": page[1],
+                    "bt_abbreviation": page[2],
+                }
+                cards = None
+                if not reparse:
+                    cards = _cached_page_cards(manifest.get(page[0]), fingerprint)
+
+                if cards is not None:
+                    parsed_pages.append((page[0], fingerprint, None, cards))
+                    continue
+
+                future = parse_pool.submit(
+                    _timed, parse_page, response.text, page[1], page[2], _SITE_URL
+                )
+                parsed_pages.append((page[0], fingerprint, future, None))
 
-                    for card_item in card_items:
-                        alternative = card_item.find(
-                            "li", class_="cardtype cardParallel"
-                        )
-
-                        popup_div = card_item.find("div", class_="popup")
-                        first_div = popup_div.find("div")
-                        colors = first_div.get("class")
-
-                        img_div = card_item.find("img")
-                        raw_image_url = img_div.get("src")
-                        image_url = "https://world.digimoncard.com" + raw_image_url[2:]
-
-                        card_head = card_item.find("ul", class_="cardinfo_head")
-                        head_elements = [
-                            element.text.strip() for element in card_head.find_all("li")
-                        ]
-
-                        rarity = head_elements[1]
-                        card_type = head_elements[2]
-                        name = card_item.find("div", class_="card_name").get_text()
-
-                        # This part handles alternative art card versions
-                        if alternative is None:
-                            card_number = head_elements[0]
-                            alternative = 0
-                        else:
-                            # Special case for alternative art get number from image URL
-                            raw_card_number = raw_image_url.split("/")[-1]
-                            raw_card_number = raw_card_number.split(".")[0]
-                            card_number = raw_card_number
-                            alternative = 1
-
-                        dd_elements = card_item.find_all("dd")
-
-                        colors = dd_elements[0].text.strip()
-                        stage = dd_elements[1].text.strip()
-                        attribute = dd_elements[2].text.strip()
-                        types = dd_elements[3].text.strip()
-                        dp = dd_elements[4].text.strip()
-                        cost = dd_elements[5].text.strip()
-                        effect = dd_elements[8].text.strip()
-                        evolution_effect = dd_elements[9].text.strip()
-                        security_effect = dd_elements[10].text.strip()
-                        evolution_cost_one = dd_elements[6].text.strip()
-                        evolution_cost_two = dd_elements[7].text.strip()
-
-                        if types == "-":
-                            types = "Null"
-                            type_one = "Null"
-                            type_two = "Null"
-                        else:
-                            if "/" in types:
-                                type_one, type_two = types.split("/", 1)
-                            else:
-                                type_one = types
-                                type_two = "Null"
-
-                        if card_type == "Digimon":
-                            if len(head_elements) >= 4:
-                                level = head_elements[3]
-                            else:
-                                level = "Null"
-                        else:
-                            level = "Null"
-
-                        if stage == "-":
-                            stage = "Null"
-
-                        if dp == "-":
-                            dp = "Null"
-
-                        if attribute == "-":
-                            attribute = "Null"
-
-                        if cost == "-":
-                            cost = "Null"
-
-                        if evolution_cost_one in ("-", ""):
-                            evolution_cost_one = "Null"
-                        else:
-                            evolution_cost_one = re.search(
-                                r"\d+", evolution_cost_one
-                            ).group()
-
-                        if evolution_cost_two in ("-", ""):
-                            evolution_cost_two = "Null"
-                        else:
-                            evolution_cost_two = re.search(
-                                r"\d+", evolution_cost_two
-                            ).group()
-
-                        if effect == "-":
-                            effect = "Null"
-
-                        if evolution_effect == "-":
-                            evolution_effect = "Null"
-
-                        if security_effect == "-":
-                            security_effect = "Null"
-
-                        color_list = colors.split()
-
-                        color_one = color_list[0]
-                        color_two = color_list[1] if len(color_list) > 1 else "NULL"
-                        color_three = color_list[2] if len(color_list) > 2 else "NULL"
-
-                        card = [
-                            card_number,
-                            name,
-                            card_type,
-                            rarity,
-                            color_one,
-                            color_two,
-                            color_three,
-                            image_url,
-                            cost,
-                            stage,
-                            attribute,
-                            type_one,
-                            type_two,
-                            evolution_cost_one,
-                            evolution_cost_two,
-                            effect,
-                            evolution_effect,
-                            security_effect,
-                            bt_abbreviation,
-                            bt_name,
-                            dp,
-                            alternative,
-                            level,
-                        ]
-
-                        csv_writer.writerow(card)
-                        print("Card written: " + card_number)
+            for url, fingerprint, future, cards in parsed_pages:
+                if future is None:
+                    reused += 1
+                    metrics.inc("pages_total", result="unchanged")
                 else:
-                    print("Could not find <ul> with class 'image_lists'.")
-            else:
-                print(f"Failed to retrieve page. Status code: {response.status_code}")
+                    cards, seconds = future.result()
+                    metrics.observe("parse_seconds", seconds)
 
-    _remove_csv_duplicates()
+                    if cards is None:
+                        print("Could not find <ul> with class 'image_lists'.")
+                        continue
 
+                    manifest[url] = _store_page_cards(url, fingerprint, cards)
+                    metrics.inc("pages_total", result="parsed")
+                    metrics.inc("cards_parsed_total", len(cards))
 
+                for card in cards:
+                    if duplicate_filter.add(card):
+                        write_card(card)
+
+        for card in duplicate_filter.held():
+            write_card(card)
+
+    session.close()
+    os.makedirs(_PAGE_CACHE, exist_ok=True)
+    atomic_write(
+        _PAGE_MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+    )
+    if reused:
+        print(f"Reused the parsed cards of {reused} unchanged pages")
+
+    metrics.inc("cards_duplicate_total", duplicate_filter.duplicates)
+    metrics.inc("cards_conflicting_total", duplicate_filter.conflicts)
+    if duplicate_filter.duplicates:
+        print(
+            f"Skipped {duplicate_filter.duplicates} duplicate cards, "
+            f"{duplicate_filter.conflicts} with different data "
+            f"(kept by the '{duplicate_filter.policy}' policy)"
+        )
+
+
+@metrics.traced("create_db_structure")
 def create_db_structure():
     """
     Creates all tables and relationships in the database.
     """
-    _create_database_if_not_exists()
+    db = _backend()
+    db.create_database()
 
     connection = _create_connection()
     cursor = connection.cursor()
 
     cursor.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS CardTypes (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {db.auto_id},
             name VARCHAR(255) NOT NULL
         )"""
     )
 
     cursor.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS Rarities (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {db.auto_id},
             name VARCHAR(255) NOT NULL
         )"""
     )
 
     cursor.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS Colors (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {db.auto_id},
             name VARCHAR(255) NOT NULL
         )"""
     )
 
     cursor.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS Stages (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {db.auto_id},
             name VARCHAR(255) NOT NULL
         )"""
     )
 
     cursor.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS Attributes (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {db.auto_id},
             name VARCHAR(255) NOT NULL
         )"""
     )
 
     cursor.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS Types (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {db.auto_id},
             name VARCHAR(255) NOT NULL
         )"""
     )
 
     cursor.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS BTs (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {db.auto_id},
             name VARCHAR(255) NOT NULL,
             abbreviation VARCHAR(50) NOT NULL
         )"""
     )
 
     cursor.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS Cards (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {db.auto_id},
             card_number VARCHAR(50) UNIQUE NOT NULL,
             name VARCHAR(255) NOT NULL,
             dp INT,
@@ -337,9 +344,9 @@ def create_db_structure():
     )
 
     cursor.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS Decks (
-            id INT AUTO_INCREMENT PRIMARY KEY,
+            id {db.auto_id},
             name VARCHAR(255) NOT NULL,
             color_id INT,
             image TEXT,
@@ -368,6 +375,8 @@ def create_db_structure():
         )"""
     )
 
+    _migrate(cursor)
+
     connection.commit()
     cursor.close()
     connection.close()
@@ -375,157 +384,486 @@ def create_db_structure():
     print("Database structure created successfully")
 
 
-def fill_db():
+@metrics.traced("fill_db")
+def fill_db(batch_size=None, resume=True, workers=None, reload=False):
     """
     Stuff the database with card data from the CSV file.
+    - Lookup tables are filled first, in one go per table
+    - Cards are upserted with multi-row inserts, committed batch by batch
+    - Safe to run again: existing cards are updated instead of failing,
+      and a crashed load picks up after the last committed batch
+    - BTs whose cards are the same as at their last load are skipped,
+      LoadedBTs keeps a fingerprint of every loaded BT
+
+    Args:
+        batch_size (int, optional): Cards per insert and commit.
+        Defaults to FILL_BATCH_SIZE from the environment.
+        resume (bool): Continue from the checkpoint left by an interrupted
+        load of the same CSV. False starts over from the first card.
+        workers (int, optional): Connections loading cards at once, one BT
+        per connection, capped by DB_POOL_SIZE. Defaults to FILL_WORKERS
+        from the environment (1, the plain sequential load). SQLite always
+        loads sequentially.
+        reload (bool): Load every BT, even unchanged ones.
     """
+    if batch_size is None:
+        batch_size = _env_int("FILL_BATCH_SIZE", 1000)
+    if workers is None:
+        workers = _env_int("FILL_WORKERS", 1)
+
+    csv_fingerprint, checkpoint = _load_fill_checkpoint()
+    if not resume:
+        checkpoint = None
+
+    # One connection per loader, and SQLite only ever takes one writer
+    workers = min(workers, _backend().max_writers)
+    if workers > 1:
+        _fill_db_parallel(workers, batch_size, csv_fingerprint, checkpoint, reload)
+        return
 
     connection = _create_connection()
     cursor = connection.cursor()
+    _migrate(cursor)
 
-    card_types = {}
-    rarities = {}
-    colors = {}
-    stages = {}
-    attributes = {}
-    types = {}
-    bt_map = {}
+    lookups = _new_lookup_caches()
+    _resolve_lookups(cursor, _read_csv_cards(), lookups)
+    connection.commit()
 
-    with open("temp/DigimonCards.csv", mode="r", encoding="utf-8") as csv_file:
-        csv_reader = csv.reader(csv_file)
-        next(csv_reader)
+    bt_fingerprints = _bt_fingerprints()
+    unchanged = set() if reload else _unchanged_bts(cursor, lookups, bt_fingerprints)
+
+    batch_number = checkpoint.get("batch", 0) if checkpoint else 0
+    skip_rows = checkpoint.get("rows", 0) if checkpoint else 0
+    if skip_rows:
+        print(f"Resuming after batch {batch_number} ({skip_rows} CSV rows already done)")
+
+    upsert_sql = _card_upsert_sql()
+    loaded = 0
+    batch = []
+    # CSV rows done so far, unchanged ones included, where a resumed load starts
+    position = skip_rows
+
+    def commit_batch():
+        nonlocal batch_number, loaded
+        with metrics.timer("db_batch_seconds", stage="fill_db"):
+            cursor.executemany(upsert_sql, batch)
+            connection.commit()
+        metrics.inc("db_rows_total", len(batch), stage="fill_db")
+        batch_number += 1
+        loaded += len(batch)
+        _write_fill_checkpoint(csv_fingerprint, batch=batch_number, rows=position)
+
+    skipped = 0
+    for index, card in enumerate(_read_csv_cards()):
+        if index < skip_rows:
+            continue
+        position = index + 1
+        if _bt_key(card) in unchanged:
+            skipped += 1
+            continue
 
-        for row in csv_reader:
-            card_number = row[0]
-            name = row[1]
-            image_url = row[7]
-            cost = row[8] if row[8].lower() != "null" else None
-            evolution_cost_one = row[13] if row[13].lower() != "null" else None
-            evolution_cost_two = row[14] if row[14].lower() != "null" else None
-            effect = row[15] if row[15].lower() != "null" else None
-            evolution_effect = row[16] if row[16].lower() != "null" else None
-            security_effect = row[17] if row[17].lower() != "null" else None
-            dp = row[20] if row[20].lower() != "null" else None
-            alternative = int(row[21])
-
-            card_type_id = _get_id(card_types, row[2], cursor, "CardTypes")
-            rarity_id = _get_id(rarities, row[3], cursor, "Rarities")
-            stage_id = (
-                _get_id(stages, row[9], cursor, "Stages")
-                if row[9].lower() != "null"
-                else None
-            )
-            attribute_id = (
-                _get_id(attributes, row[10], cursor, "Attributes")
-                if row[10].lower() != "null"
-                else None
-            )
-            type_one_id = _get_id(types, row[11], cursor, "Types")
-            type_two_id = (
-                _get_id(types, row[12], cursor, "Types")
-                if row[12].lower() != "null"
-                else None
-            )
+        batch.append(_card_values(card, cursor, lookups))
 
-            color_one_id = _get_id(colors, row[4], cursor, "Colors")
-            color_two_id = (
-                _get_id(colors, row[5], cursor, "Colors")
-                if row[5].lower() != "null"
-                else None
-            )
-            color_three_id = (
-                _get_id(colors, row[6], cursor, "Colors")
-                if row[6].lower() != "null"
-                else None
-            )
+        if len(batch) >= batch_size:
+            commit_batch()
+            batch = []
 
-            _insert_bt(cursor, row[18], row[19], bt_map)
-            bt_id = bt_map[f"{row[18]}_{row[19]}"]
+    if batch:
+        commit_batch()
 
-            cursor.execute(
-                """
-                INSERT INTO Cards (
-                    card_number, name, dp, card_type_id, rarity_id, color_one_id, color_two_id, color_three_id,
-                    image_url, cost, stage_id, attribute_id, type_one_id, type_two_id,
-                    evolution_cost_one, evolution_cost_two, effect, evolution_effect, 
-                    security_effect, bt_id, alternative
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """,
-                (
-                    card_number,
-                    name,
-                    dp,
-                    card_type_id,
-                    rarity_id,
-                    color_one_id,
-                    color_two_id,
-                    color_three_id,
-                    image_url,
-                    cost,
-                    stage_id,
-                    attribute_id,
-                    type_one_id,
-                    type_two_id,
-                    evolution_cost_one,
-                    evolution_cost_two,
-                    effect,
-                    evolution_effect,
-                    security_effect,
-                    bt_id,
-                    alternative,
-                ),
-            )
+    _record_loaded_bts(
+        cursor,
+        lookups,
+        {key: sha for key, sha in bt_fingerprints.items() if key not in unchanged},
+    )
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+    if os.path.exists(_FILL_CHECKPOINT):
+        os.remove(_FILL_CHECKPOINT)
+    metrics.inc("db_rows_skipped_total", skipped, stage="fill_db")
+    if unchanged:
+        print(f"Skipped {skipped} cards of {len(unchanged)} unchanged BTs")
+    print(f"Database populated successfully with {loaded} cards")
 
+
+def _fill_db_parallel(workers, batch_size, csv_fingerprint, checkpoint, reload):
+    """
+    fill_db spread over several pooled connections.
+    Lookup ids are resolved once up front, then every BT's cards go in as
+    their own shard on their own connection, committing independently.
+    Finished BTs are checkpointed, so a crashed load only redoes the rest,
+    and unchanged BTs aren't loaded at all.
+    """
+    connection = _create_connection()
+    cursor = connection.cursor()
+    _migrate(cursor)
+
+    lookups = _new_lookup_caches()
+    _resolve_lookups(cursor, _read_csv_cards(), lookups)
     connection.commit()
+
+    bt_fingerprints = _bt_fingerprints()
+    unchanged = set() if reload else _unchanged_bts(cursor, lookups, bt_fingerprints)
     cursor.close()
     connection.close()
-    print("Database populated successfully")
 
+    shards = {}
+    for card in _read_csv_cards():
+        shards.setdefault(_bt_key(card), []).append(card)
+
+    done = set(checkpoint.get("shards", [])) if checkpoint else set()
+    if done:
+        print(f"Resuming with {len(done)} of {len(shards)} BTs already loaded")
+    if unchanged:
+        skipped = sum(len(shards[bt_key]) for bt_key in unchanged)
+        metrics.inc("db_rows_skipped_total", skipped, stage="fill_db")
+        print(f"Skipped {skipped} cards of {len(unchanged)} unchanged BTs")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                _load_shard, cards, lookups, batch_size, bt_fingerprints[bt_key]
+            ): bt_key
+            for bt_key, cards in shards.items()
+            if bt_key not in done and bt_key not in unchanged
+        }
+        for future in as_completed(futures):
+            future.result()
+            done.add(futures[future])
+            _write_fill_checkpoint(csv_fingerprint, shards=sorted(done))
 
-def download_images():
+    # Every card of every BT should be there now, whatever order they landed in
+    connection = _create_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT bt_id, COUNT(*) FROM Cards GROUP BY bt_id")
+    stored = dict(cursor.fetchall())
+    cursor.close()
+    connection.close()
+
+    missing = {
+        bt_key: len(cards) - stored.get(lookups["BTs"][bt_key], 0)
+        for bt_key, cards in shards.items()
+        if stored.get(lookups["BTs"][bt_key], 0) < len(cards)
+    }
+    if missing:
+        for bt_key, count in missing.items():
+            print(f"Row count check failed: {count} cards of {bt_key} missing")
+        raise RuntimeError("Parallel load left cards out, run it again")
+
+    if os.path.exists(_FILL_CHECKPOINT):
+        os.remove(_FILL_CHECKPOINT)
+    loaded = sum(
+        len(cards) for bt_key, cards in shards.items() if bt_key not in unchanged
+    )
+    print(
+        f"Database populated successfully with {loaded} cards "
+        f"({len(shards) - len(unchanged)} BTs over {workers} connections)"
+    )
+
+
+def _load_shard(cards, lookups, batch_size, bt_fingerprint):
     """
-    Snags card images from the web and converts them to tidy WebP format.
+    Upserts one BT's cards over a connection of its own, committing each batch.
+    Runs on a loader thread, so lookups must already hold every id needed.
+    Batches that lose a deadlock to another loader are retried.
+    The BT's fingerprint is recorded once all of its cards are in.
     """
-    df = pd.read_csv("temp/DigimonCards.csv")
+    db = _backend()
+    connection = _create_connection()
+    if connection is None:
+        raise RuntimeError("No database connection for the card loader")
+
+    cursor = connection.cursor()
+    upsert_sql = _card_upsert_sql()
+    try:
+        for start in range(0, len(cards), batch_size):
+            batch = [
+                _card_values(card, cursor, lookups)
+                for card in cards[start : start + batch_size]
+            ]
+            for attempt in range(3):
+                try:
+                    with metrics.timer("db_batch_seconds", stage="fill_db"):
+                        cursor.executemany(upsert_sql, batch)
+                        connection.commit()
+                    break
+                except Exception as e:
+                    connection.rollback()
+                    if not db.is_retryable(e) or attempt == 2:
+                        raise
+                    metrics.inc("db_retries_total", stage="fill_db")
+                    time.sleep(0.1 * (attempt + 1))
+            metrics.inc("db_rows_total", len(batch), stage="fill_db")
+
+        _record_loaded_bts(cursor, lookups, {_bt_key(cards[0]): bt_fingerprint})
+        connection.commit()
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def _bt_fingerprints():
+    """
+    Hash of every BT's cards in the CSV, as fill_db would load them.
+
+    Returns:
+        dict: sha256 hex digest per BT key.
+    """
+    hashes = {}
+    for card in _read_csv_cards():
+        sha = hashes.setdefault(_bt_key(card), hashlib.sha256())
+        sha.update(_card_hash(card).encode("ascii"))
+    return {bt_key: sha.hexdigest() for bt_key, sha in hashes.items()}
+
+
+def _unchanged_bts(cursor, lookups, bt_fingerprints):
+    """
+    BTs loaded before with exactly the cards the CSV has now, and whose
+    cards are all still in the database.
+
+    Returns:
+        set: BT keys fill_db can leave alone.
+    """
+    cursor.execute("SELECT bt_id, rows_sha256 FROM LoadedBTs")
+    loaded = dict(cursor.fetchall())
+    cursor.execute("SELECT bt_id, COUNT(*) FROM Cards GROUP BY bt_id")
+    stored = dict(cursor.fetchall())
+
+    counts = {}
+    for card in _read_csv_cards():
+        bt_key = _bt_key(card)
+        counts[bt_key] = counts.get(bt_key, 0) + 1
+
+    unchanged = set()
+    for bt_key, sha in bt_fingerprints.items():
+        bt_id = lookups["BTs"][bt_key]
+        if loaded.get(bt_id) == sha and stored.get(bt_id) == counts[bt_key]:
+            unchanged.add(bt_key)
+    return unchanged
+
+
+def _record_loaded_bts(cursor, lookups, bt_fingerprints):
+    """Saves the fingerprints of the BTs just loaded, see _unchanged_bts."""
+    if not bt_fingerprints:
+        return
+    cursor.executemany(
+        "INSERT INTO LoadedBTs (bt_id, rows_sha256) VALUES (%s, %s) "
+        + _backend().upsert(("bt_id",), ("rows_sha256",)),
+        [(lookups["BTs"][bt_key], sha) for bt_key, sha in bt_fingerprints.items()],
+    )
+
 
-    if not os.path.exists("img"):
-        os.makedirs("img")
+@metrics.traced("download_images")
+def download_images(
+    fetch_workers=None,
+    encode_workers=None,
+    quality=None,
+    method=None,
+    widths=None,
+    refresh=False,
+    from_db=False,
+):
+    """
+    Snags card images from the web and converts them to tidy WebP format.
+    - Each image is also scaled down to thumbnails, img/<width>/<card>.webp
+    - Encoded files are kept once in img/store, named after the SHA-256 of
+      the downloaded image, and the per-card files are hard links to them.
+      Alternative arts sharing the same artwork are encoded and stored once.
+    - img/manifest.json maps every card to its files with dimensions, size
+      in bytes and SHA-256, plus the ETag/Last-Modified of the download
+    - Cards already in the manifest are skipped while their stored files
+      exist. refresh=True asks the site about each one with a conditional
+      request instead, and only changed images are downloaded and encoded.
+    - Downloads run on threads and the WebP encoding on worker processes.
+      Only a limited number of downloaded images may wait for an encoder,
+      past that the downloads hold off until encoding catches up.
 
+    Args:
+        fetch_workers (int, optional): Concurrent downloads.
+        Defaults to IMAGE_FETCH_WORKERS from the environment.
+        encode_workers (int, optional): Encoding processes.
+        Defaults to IMAGE_ENCODE_WORKERS from the environment, or one per CPU.
+        quality (int, optional): WebP quality, 0-100.
+        Defaults to WEBP_QUALITY from the environment.
+        method (int, optional): WebP effort, 0 (fast) to 6 (smallest files).
+        Defaults to WEBP_METHOD from the environment.
+        widths (list, optional): Thumbnail widths in pixels.
+        Defaults to THUMBNAIL_WIDTHS from the environment.
+        refresh (bool): Re-check images that are already downloaded.
+        from_db (bool): Read the card list from the Cards table instead of
+        the CSV.
+    """
+    from tqdm import tqdm
+
+    if fetch_workers is None:
+        fetch_workers = _env_int("IMAGE_FETCH_WORKERS", 16)
+    if encode_workers is None:
+        encode_workers = _env_int("IMAGE_ENCODE_WORKERS", os.cpu_count() or 1)
+    if quality is None:
+        quality = _env_int("WEBP_QUALITY", 80)
+    if method is None:
+        method = _env_int("WEBP_METHOD", 4)
+    if widths is None:
+        widths = [
+            int(width)
+            for width in os.getenv("THUMBNAIL_WIDTHS", "128,256,512").split(",")
+            if width.strip()
+        ]
+
+    total, image_urls = _image_urls(from_db)
+
+    os.makedirs(_IMAGE_STORE, exist_ok=True)
+    for width in widths:
+        os.makedirs(os.path.join("img", str(width)), exist_ok=True)
+
+    manifest = _read_image_manifest()
+    wanted_sizes = {"full"} | {str(width) for width in widths}
+    # Stored images by the hash of their download, to spot shared artwork
+    stored = {
+        entry["source"]["sha256"]: entry
+        for entry in manifest.values()
+        if _image_stored(entry, wanted_sizes)
+    }
+
+    session = _create_session(fetch_workers)
+    backlog = threading.BoundedSemaphore(encode_workers * 2)
+    encodes = {}
+    encodes_lock = threading.Lock()
     processed_count = 0
-    max_workers = 10
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor, tqdm(
-        total=len(df)
-    ) as progress:
-        futures = []
-        for _, row in df.iterrows():
-            card_number = str(row["card_number"])
-            image_url = row["image_url"]
-
-            if pd.notna(image_url):
-                if os.path.exists(f"img/{card_number}.webp"):
+    unchanged_count = 0
+    failed_count = 0
+
+    encode_pool = _process_pool(encode_workers)
+    fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers)
+
+    with encode_pool, fetch_pool, tqdm(total=total) as progress:
+
+        def encode(data, source_sha, card_number):
+            backlog.acquire()
+            with encodes_lock:
+                # Identical artwork already on its way through the encoders
+                if source_sha in encodes:
+                    backlog.release()
+                    return encodes[source_sha]
+
+                try:
+                    future = encode_pool.submit(
+                        _timed,
+                        _encode_webp,
+                        data,
+                        card_number,
+                        source_sha,
+                        quality,
+                        method,
+                        widths,
+                    )
+                except BaseException:
+                    # A broken pool (an encoder killed for memory) must not
+                    # keep the slot, or the other fetchers wait on it forever
+                    encodes.pop(source_sha, None)
+                    backlog.release()
+                    raise
+                encodes[source_sha] = future
+
+            future.add_done_callback(encoded)
+            return future
+
+        def encoded(future):
+            backlog.release()
+            if future.exception() is None:
+                metrics.observe("image_encode_seconds", future.result()[1])
+
+        def fetch(image_url, card_number):
+            headers = {}
+            source = manifest.get(card_number, {}).get("source")
+            if refresh and source:
+                if source.get("etag"):
+                    headers["If-None-Match"] = source["etag"]
+                if source.get("last_modified"):
+                    headers["If-Modified-Since"] = source["last_modified"]
+
+            response = _download_image(session, image_url, card_number, headers)
+            if response is None:
+                return _DOWNLOAD_FAILED
+            if response.status_code == 304:
+                return None
+
+            source = {
+                "url": image_url,
+                "sha256": hashlib.sha256(response.content).hexdigest(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+
+            known = stored.get(source["sha256"])
+            if known and _image_stored(known, wanted_sizes):
+                return source, known
+            return source, encode(response.content, source["sha256"], card_number)
+
+        fetches = []
+        for card_number, image_url in image_urls:
+            if image_url:
+                entry = manifest.get(card_number)
+                if not refresh and entry and _image_stored(entry, wanted_sizes):
+                    # Put back any per-card file that went missing
+                    _link_card_images(card_number, entry["source"], entry)
                     progress.update(1)
                     continue
 
-                future = executor.submit(
-                    _download_convert_image, image_url, card_number
-                )
-                future.add_done_callback(lambda _: progress.update(1))
-                futures.append(future)
-
-        for future in futures:
-            future.result()
+                fetched = fetch_pool.submit(fetch, image_url, card_number)
+                fetched.add_done_callback(lambda _: progress.update(1))
+                fetches.append((card_number, fetched))
+
+        for card_number, fetched in fetches:
+            result = fetched.result()
+            if result is None:
+                unchanged_count += 1
+                continue
+            if result is _DOWNLOAD_FAILED:
+                failed_count += 1
+                continue
+
+            source, variants = result
+            if not isinstance(variants, dict):
+                variants = variants.result()[0]
+            if not variants:
+                failed_count += 1
+                continue
+
+            entry = _link_card_images(card_number, source, variants)
+            manifest[card_number] = entry
+            stored[source["sha256"]] = entry
             processed_count += 1
 
-    print(f"Processed {processed_count} images")
+    session.close()
+    metrics.inc("images_total", processed_count, result="processed")
+    metrics.inc("images_total", unchanged_count, result="unchanged")
+    metrics.inc("images_total", failed_count, result="failed")
+    metrics.inc("images_encoded_total", len(encodes))
+    atomic_write(
+        _IMAGE_MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8")
+    )
+    print(f"Processed {processed_count} images ({len(encodes)} encoded)")
+    if refresh:
+        print(f"{unchanged_count} images unchanged")
+    if failed_count:
+        print(f"{failed_count} images could not be downloaded or converted")
 
 
+@metrics.traced("update_db")
 def update_db():
     """
     Freshens up the database with new cards.
     - Clears old CSV to avoid mixups
     - Only adds shiny new BTs you don't have yet
+    - Finishes an interrupted load first, if there is one
     """
+    if _load_fill_checkpoint()[1]:
+        print("Finishing the interrupted database load first")
+        fill_db()
+
     csv_path = "temp/DigimonCards.csv"
     if os.path.exists(csv_path):
         try:
@@ -545,7 +883,7 @@ def update_db():
     cursor.close()
     connection.close()
 
-    web_bts = _list_BTs()
+    web_bts = _list_BTs(cache=_create_http_cache())
 
     new_bts = [bt for bt in web_bts if (bt[2], bt[1]) not in existing_bts]
 
@@ -560,132 +898,721 @@ def update_db():
     print("Base de datos actualizada correctamente")
 
 
-def import_collection_from_json(json_path):
+@metrics.traced("sync_db")
+def sync_db(prune=False):
+    """
+    Brings the database in line with the website card by card.
+    - Scrapes every BT and hashes each card row
+    - Inserts new cards and updates only the ones whose hash changed
+    - Cards gone from a scraped BT are reported, and deleted if prune is set
+
+    Args:
+        prune (bool): Delete cards the website no longer lists. Off by
+        default because it also drops them from decks and the collection.
+    """
+    create_csv()
+
+    connection = _create_connection()
+    if connection is None:
+        print("Could not connect to the database.")
+        return
+
+    cursor = connection.cursor()
+    _migrate(cursor)
+
+    cursor.execute(
+        """
+        SELECT c.card_number, c.content_hash, b.abbreviation, b.name
+        FROM Cards c LEFT JOIN BTs b ON b.id = c.bt_id
+        """
+    )
+    stored = {row[0]: (row[1], (row[2], row[3])) for row in cursor.fetchall()}
+
+    lookups = _new_lookup_caches()
+    _resolve_lookups(cursor, _read_csv_cards(), lookups)
+
+    insert_sql = _card_insert_sql()
+    update_sql = _card_update_sql()
+
+    added = 0
+    updated = 0
+    unchanged = 0
+    scraped_cards = set()
+    scraped_bts = set()
+    touched_bts = set()
+
+    for card in _read_csv_cards():
+        card_number = card.card_number
+        scraped_cards.add(card_number)
+        scraped_bts.add((card.bt_abbreviation, card.bt_name))
+
+        stored_card = stored.get(card_number)
+        if stored_card is None:
+            cursor.execute(insert_sql, _card_values(card, cursor, lookups))
+            touched_bts.add(lookups["BTs"][_bt_key(card)])
+            added += 1
+        elif stored_card[0] != _card_hash(card):
+            values = _card_values(card, cursor, lookups)
+            # UPDATE takes card_number last, for the WHERE clause
+            cursor.execute(update_sql, values[1:] + values[:1])
+            touched_bts.add(lookups["BTs"][_bt_key(card)])
+            updated += 1
+        else:
+            unchanged += 1
+
+    # Only BTs that were actually scraped can tell us a card is gone,
+    # a page that failed to download must not wipe its cards
+    missing = [
+        card_number
+        for card_number, (_, bt) in stored.items()
+        if card_number not in scraped_cards and bt in scraped_bts
+    ]
+
+    deleted = 0
+    if prune and missing:
+        cursor.executemany(
+            "DELETE FROM Cards WHERE card_number = %s",
+            [(card_number,) for card_number in missing],
+        )
+        deleted = len(missing)
+        for card_number in missing:
+            abbreviation, name = stored[card_number][1]
+            touched_bts.add(lookups["BTs"][f"{abbreviation}_{name}"])
+
+    # fill_db has to load these BTs again next time, their rows no longer
+    # match the fingerprint it recorded in LoadedBTs
+    if touched_bts:
+        cursor.executemany(
+            "DELETE FROM LoadedBTs WHERE bt_id = %s",
+            [(bt_id,) for bt_id in touched_bts],
+        )
+
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+    for result, count in (
+        ("added", added),
+        ("updated", updated),
+        ("deleted", deleted),
+        ("unchanged", unchanged),
+    ):
+        metrics.inc("sync_cards_total", count, result=result)
+
+    print(
+        f"Sync completed: {added} added, {updated} updated, "
+        f"{deleted} deleted, {unchanged} unchanged"
+    )
+    if missing and not prune:
+        print(
+            f"{len(missing)} cards are no longer listed on the website, "
+            "run sync_db(prune=True) to delete them"
+        )
+
+
+@metrics.traced("import_collection")
+def import_collection_from_json(json_path, user_id=DEFAULT_USER_ID, batch_size=None):
     """
     Import cards from JSON to the MySQL database
     It is designed to work with JSON generated from https://digimoncard.app
-    """
-    # Read the JSON file
-    with open(json_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)
+    - The JSON is streamed, never loaded whole
+    - Entries go into a temporary staging table in batches
+    - One INSERT ... SELECT merges them into Collection, joined to Cards
+      so only known cards get in, and one anti-join lists the rest
 
-    collection = data.get("collection", [])
-    merged_collection = {}
+    Args:
+        json_path (str): The collection JSON.
+        user_id (int): Whose collection it is, see get_user_id.
+        batch_size (int, optional): Entries per staging insert.
+        Defaults to FILL_BATCH_SIZE from the environment.
+    """
+    from json_stream import iter_list
 
-    # Merge card variants by normalizing ID and summing counts
-    for item in collection:
-        raw_id = item.get("id")
-        count = item.get("count", 0)
+    if batch_size is None:
+        batch_size = _env_int("FILL_BATCH_SIZE", 1000)
 
-        if count <= 0:
-            continue
+    connection = _create_connection()
+    if not connection:
+        print("Could not connect to the database.")
+        return
 
-        normalized_id = re.sub(r'_P\d+$', '', raw_id)
-        merged_collection[normalized_id] = merged_collection.get(normalized_id, 0) + count
+    cursor = connection.cursor()
+    _migrate(cursor)
+    connection.commit()
 
-    if not merged_collection:
-        print("No valid cards to import.")
+    cursor.execute("SELECT 1 FROM Users WHERE id = %s", (user_id,))
+    if cursor.fetchone() is None:
+        print(f"No user with id {user_id}.")
+        cursor.close()
+        connection.close()
         return
 
+    drop_staging = _backend().drop_temporary.format("CollectionStaging")
+    cursor.execute(drop_staging)
+    cursor.execute(
+        """
+        CREATE TEMPORARY TABLE CollectionStaging (
+            card_number VARCHAR(50) NOT NULL,
+            quantity INT NOT NULL
+        )"""
+    )
+
+    insert_sql = "INSERT INTO CollectionStaging (card_number, quantity) VALUES (%s, %s)"
+    try:
+        # Card variants (_P1, _P2...) count as the base card
+        staged = 0
+        batch = []
+        for item in iter_list(json_path, "collection"):
+            count = int(item.get("count", 0))
+            if count <= 0:
+                continue
+            batch.append((re.sub(r"_P\d+$", "", item.get("id")), count))
+            if len(batch) >= batch_size:
+                cursor.executemany(insert_sql, batch)
+                staged += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert_sql, batch)
+            staged += len(batch)
+
+        if not staged:
+            print("No valid cards to import.")
+            return
+
+        # Variants summed per card, cards not in the database left out
+        cursor.execute(
+            """
+            INSERT INTO Collection (user_id, card_number, quantity)
+            SELECT %s, s.card_number, SUM(s.quantity)
+            FROM CollectionStaging s
+            JOIN Cards c ON c.card_number = s.card_number
+            GROUP BY s.card_number
+            """
+            + _backend().upsert(("user_id", "card_number"), ("quantity",)),
+            (user_id,),
+        )
+
+        cursor.execute(
+            """
+            SELECT DISTINCT s.card_number
+            FROM CollectionStaging s
+            LEFT JOIN Cards c ON c.card_number = s.card_number
+            WHERE c.card_number IS NULL
+            """
+        )
+        invalid_cards = [row[0] for row in cursor.fetchall()]
+        for invalid in invalid_cards:
+            print(f"[!] Card not found in the database: {invalid}")
+
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        # A failing DROP must not hide the error that got us here
+        try:
+            cursor.execute(drop_staging)
+        except Exception as e:
+            print(f"Could not drop the staging table: {e}")
+        cursor.close()
+        connection.close()
+
+    metrics.inc("collection_entries_total", staged)
+    metrics.inc("collection_invalid_total", len(invalid_cards))
+    print("Collection import completed.")
+
+
+def get_user_id(name, create=False):
+    """
+    Looks up a user by name.
+
+    Args:
+        name (str): The user's name.
+        create (bool): Add the user if there's none by that name.
+
+    Returns:
+        int: The user's id, or None if there's no such user.
+    """
     connection = _create_connection()
     if not connection:
         print("Could not connect to the database.")
-        return
+        return None
 
     cursor = connection.cursor()
+    _migrate(cursor)
+    connection.commit()
+
+    cursor.execute("SELECT id FROM Users WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    if row:
+        user_id = row[0]
+    elif create:
+        user_id = _get_id({}, name, cursor, "Users")
+        connection.commit()
+    else:
+        user_id = None
+
+    cursor.close()
+    connection.close()
+    return user_id
+
+
+def missing_cards(bt_abbreviation, user_id=DEFAULT_USER_ID):
+    """
+    Cards of a BT the user doesn't have.
+    Both sides are read from indexes only: the BT's cards from
+    idx_cards_bt, the user's from Collection's (user_id, card_number) key,
+    so it costs the same however many users there are.
+
+    Args:
+        bt_abbreviation (str): Like "BT-01".
+        user_id (int): Whose collection to check.
 
-    card_ids = list(merged_collection.keys())
-
-    # Batch query: Get valid card numbers from Cards table
-    format_strings = ','.join(['%s'] * len(card_ids))
-    cursor.execute(f"SELECT card_number FROM Cards WHERE card_number IN ({format_strings})", card_ids)
-    valid_cards = {row[0] for row in cursor.fetchall()}
-
-    # Batch query: Get existing quantities from Collection table
-    cursor.execute(f"SELECT card_number, quantity FROM Collection WHERE card_number IN ({format_strings})", card_ids)
-    existing_collection = {row[0]: row[1] for row in cursor.fetchall()}
-
-    # Process valid cards only
-    for card_id in valid_cards:
-        new_count = merged_collection[card_id]
-        current_count = existing_collection.get(card_id)
-
-        if current_count is None:
-            # Insert new record
-            cursor.execute("""
-                INSERT INTO Collection (card_number, quantity)
-                VALUES (%s, %s)
-            """, (card_id, new_count))
-        elif current_count != new_count:
-            # Update existing record only if count changed
-            cursor.execute("""
-                UPDATE Collection
-                SET quantity = %s
-                WHERE card_number = %s
-            """, (new_count, card_id))
-
-    # Log invalid cards
-    invalid_cards = set(card_ids) - valid_cards
-    for invalid in invalid_cards:
-        print(f"[!] Card not found in the database: {invalid}")
+    Returns:
+        list: Card numbers of every missing card.
+    """
+    connection = _create_connection()
+    if not connection:
+        print("Could not connect to the database.")
+        return []
 
+    cursor = connection.cursor()
+    _migrate(cursor)
     connection.commit()
+
+    cursor.execute(
+        """
+        SELECT c.card_number
+        FROM BTs b
+        JOIN Cards c ON c.bt_id = b.id
+        WHERE b.abbreviation = %s
+          AND NOT EXISTS (
+              SELECT 1 FROM Collection o
+              WHERE o.user_id = %s AND o.card_number = c.card_number
+          )
+        ORDER BY c.card_number
+        """,
+        (bt_abbreviation, user_id),
+    )
+    missing = [row[0] for row in cursor.fetchall()]
     cursor.close()
     connection.close()
-    print("Collection import completed.")
+    return missing
 
 
 def _create_connection():
     """
-    Connecting to the database
+    Connecting to the database picked by _backend.
+    Closing the connection hands it back (to the pool, for MySQL).
+    Every query on it is counted and timed in the metrics.
     Returns:
-        connection: MySQL hookup or None if something's broken
+        connection: Database hookup or None if something's broken
     """
-    try:
-        connection = mysql.connector.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            database=os.getenv("DB_NAME"),
-        )
-        return connection
-    except Error as e:
-        print(f"MySQL connection error: {e}")
-        return None
+    return metrics.instrument(_backend().connect())
 
 
-def _create_database_if_not_exists():
+def _backend():
     """
-    Checks if the database exists and creates it if not.
+    The storage backend every stage shares, picked the first time it's needed.
+    DB_BACKEND=sqlite keeps everything in the SQLITE_PATH file, anything else
+    means the MySQL server from the .env, pooled by DB_POOL_SIZE
+    (5 by default, 32 at most).
     """
-    db_name = os.getenv("DB_NAME")
-    if not db_name:
-        print("Error: DB_NAME is not defined in environment variables.")
-        return
+    global _storage
 
-    try:
-        # Connect without specifying database
-        connection = mysql.connector.connect(
-            host=os.getenv("DB_HOST"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
+    with _storage_lock:
+        if _storage is None:
+            if os.getenv("DB_BACKEND", "mysql").lower() == "sqlite":
+                _storage = SQLiteBackend(os.getenv("SQLITE_PATH", "DigimonCards.db"))
+            else:
+                _storage = MySQLBackend(
+                    pool_size=_env_int("DB_POOL_SIZE", 5),
+                    pool_timeout=_env_float("DB_POOL_TIMEOUT", 30),
+                )
+        return _storage
+
+
+def _migrate(cursor):
+    """
+    Brings an existing database up to the latest schema.
+    SchemaVersion remembers how many _MIGRATIONS were applied, so each
+    step runs once and older databases are upgraded in place.
+    """
+    cursor.execute("CREATE TABLE IF NOT EXISTS SchemaVersion (version INT NOT NULL)")
+    cursor.execute("SELECT version FROM SchemaVersion")
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute("INSERT INTO SchemaVersion (version) VALUES (0)")
+    current = row[0] if row else 0
+
+    for version, migration in enumerate(_MIGRATIONS, start=1):
+        if version > current:
+            migration(cursor)
+            cursor.execute("UPDATE SchemaVersion SET version = %s", (version,))
+            print(f"Applied schema migration {version}: {migration.__doc__.strip()}")
+
+
+def _migration_card_hashes(cursor):
+    """Content hash per card for sync_db"""
+    _add_column_if_missing(cursor, "Cards", "content_hash", "CHAR(64)")
+
+
+def _migration_unique_lookups(cursor):
+    """Unique names in the lookup tables"""
+    # Duplicates have to go before the unique index can be built,
+    # cards pointing at a duplicate are moved to the oldest row first
+    references = {
+        "CardTypes": [("Cards", "card_type_id")],
+        "Rarities": [("Cards", "rarity_id")],
+        "Colors": [
+            ("Cards", "color_one_id"),
+            ("Cards", "color_two_id"),
+            ("Cards", "color_three_id"),
+            ("Decks", "color_id"),
+        ],
+        "Stages": [("Cards", "stage_id")],
+        "Attributes": [("Cards", "attribute_id")],
+        "Types": [("Cards", "type_one_id"), ("Cards", "type_two_id")],
+        "BTs": [("Cards", "bt_id")],
+    }
+
+    db = _backend()
+    for table, columns in references.items():
+        key = "abbreviation, name" if table == "BTs" else "name"
+        db.merge_duplicates(cursor, table, key, columns)
+        _add_index_if_missing(
+            cursor, table, f"uq_{table.lower()}_name", key, "UNIQUE INDEX"
         )
-        cursor = connection.cursor()
 
-        # Check database existence
-        cursor.execute(
-            "SELECT SCHEMA_NAME FROM INFORMATION_SCHEMA.SCHEMATA WHERE SCHEMA_NAME = %s",
-            (db_name,)
+
+def _migration_card_indexes(cursor):
+    """Card levels plus indexes for the usual card filters"""
+    _add_column_if_missing(cursor, "Cards", "level", "INT")
+    # Hashes were taken before level was stored, clearing them makes the
+    # next sync_db fill in the level of every card
+    cursor.execute("UPDATE Cards SET content_hash = NULL")
+
+    _add_index_if_missing(cursor, "Cards", "idx_cards_bt", "bt_id, card_number")
+    _add_index_if_missing(
+        cursor, "Cards", "idx_cards_color", "color_one_id, card_type_id"
+    )
+    _add_index_if_missing(
+        cursor, "Cards", "idx_cards_type", "card_type_id, level, cost"
+    )
+    _add_index_if_missing(cursor, "Cards", "idx_cards_level_cost", "level, cost")
+    _add_index_if_missing(cursor, "Cards", "idx_cards_name", "name")
+    _add_index_if_missing(
+        cursor,
+        "Cards",
+        "ft_cards_effects",
+        "effect, evolution_effect, security_effect",
+        "FULLTEXT INDEX",
+    )
+
+
+def _migration_loaded_bts(cursor):
+    """Fingerprint of every loaded BT, so fill_db can skip unchanged ones"""
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS LoadedBTs (
+            bt_id INT PRIMARY KEY,
+            rows_sha256 CHAR(64) NOT NULL,
+            FOREIGN KEY (bt_id) REFERENCES BTs(id) ON DELETE CASCADE
         )
-        if not cursor.fetchone():
-            cursor.execute(f"CREATE DATABASE {db_name}")
-            print(f"Database '{db_name}' created successfully.")
+        """
+    )
 
-        cursor.close()
-        connection.close()
 
-    except Error as e:
-        print(f"Database creation error: {e}")
+def _migration_owned_collections(cursor):
+    """Users owning collections and decks"""
+    db = _backend()
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS Users (
+            id {db.auto_id},
+            name VARCHAR(255) NOT NULL UNIQUE
+        )"""
+    )
+    # Whatever was there before belongs to the default user
+    cursor.execute(
+        f"INSERT INTO Users (id, name) VALUES (%s, %s) {db.lookup_upsert}",
+        (DEFAULT_USER_ID, "default"),
+    )
+
+    # The primary key can't be changed in place on SQLite, so the table is
+    # rebuilt. Rows are stored in (user_id, card_number) order: one user's
+    # collection is a single range of the key.
+    # Every step commits on its own on MySQL, so a rebuild cut short is
+    # picked up where it stopped. A leftover CollectionByUser is kept, not
+    # dropped: if it got as far as dropping the old Collection, schema has
+    # since recreated that one empty and the copy holds the only rows. The
+    # copy is an upsert, so rows copied last time are just copied again.
+    if not db.has_column(cursor, "Collection", "user_id"):
+        if db.has_column(cursor, "Collection", "card_number"):
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS CollectionByUser (
+                    user_id INT NOT NULL,
+                    card_number VARCHAR(50) NOT NULL,
+                    quantity INT NOT NULL DEFAULT 1,
+                    PRIMARY KEY (user_id, card_number),
+                    FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE,
+                    FOREIGN KEY (card_number) REFERENCES Cards(card_number)
+                        ON DELETE CASCADE
+                ) {db.clustered}"""
+            )
+            cursor.execute(
+                "INSERT INTO CollectionByUser (user_id, card_number, quantity) "
+                "SELECT %s, card_number, quantity FROM Collection WHERE TRUE "
+                + db.upsert(("user_id", "card_number"), ("quantity",)),
+                (DEFAULT_USER_ID,),
+            )
+            cursor.execute("DROP TABLE Collection")
+        cursor.execute("ALTER TABLE CollectionByUser RENAME TO Collection")
+    # Who owns a card, and the cascade when a card is deleted
+    _add_index_if_missing(
+        cursor, "Collection", "idx_collection_card", "card_number, user_id"
+    )
+
+    # DeckCards points at Decks.id, so decks keep their id as the key and
+    # are found by owner through the index. No foreign key to Users here,
+    # SQLite can't add one to an existing table.
+    _add_column_if_missing(
+        cursor, "Decks", "user_id", f"INT NOT NULL DEFAULT {DEFAULT_USER_ID}"
+    )
+    _add_index_if_missing(cursor, "Decks", "idx_decks_user", "user_id, name")
+    _add_index_if_missing(
+        cursor, "DeckCards", "idx_deckcards_deck", "deck_id, card_number, quantity"
+    )
+
+
+# Applied in order by _migrate, only ever append to this list
+_MIGRATIONS = [
+    _migration_card_hashes,
+    _migration_unique_lookups,
+    _migration_card_indexes,
+    _migration_loaded_bts,
+    _migration_owned_collections,
+]
+
+
+def _add_index_if_missing(cursor, table, index_name, columns, kind="INDEX"):
+    """Creates an index on an existing table if it isn't there yet."""
+    db = _backend()
+    if not db.has_index(cursor, table, index_name):
+        db.create_index(cursor, table, index_name, columns, kind)
+
+
+def _add_column_if_missing(cursor, table, column, definition):
+    """Adds a column to an existing table if it isn't there yet."""
+    if not _backend().has_column(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _new_lookup_caches():
+    """Empty name -> id caches for every lookup table, used by _card_values."""
+    return {
+        "CardTypes": {},
+        "Rarities": {},
+        "Colors": {},
+        "Stages": {},
+        "Attributes": {},
+        "Types": {},
+        "BTs": {},
+    }
+
+
+def _read_csv_cards():
+    """Streams the cards of the CSV as CardRecords, header left out."""
+    with open("temp/DigimonCards.csv", mode="r", encoding="utf-8") as csv_file:
+        csv_reader = csv.reader(csv_file)
+        next(csv_reader)
+        for row in csv_reader:
+            yield CardRecord.from_csv_row(row)
+
+
+def _bt_key(card):
+    """Key of the card's BT in the lookups["BTs"] cache."""
+    return f"{card.bt_abbreviation}_{card.bt_name}"
+
+
+def _lookup_values(card):
+    """Every (table, name) pair a card needs from the lookup tables."""
+    pairs = (
+        ("CardTypes", card.card_type),
+        ("Rarities", card.rarity),
+        ("Colors", card.color_one),
+        ("Colors", card.color_two),
+        ("Colors", card.color_three),
+        ("Stages", card.stage),
+        ("Attributes", card.attribute),
+        ("Types", card.type_one),
+        ("Types", card.type_two),
+    )
+    return [(table, value) for table, value in pairs if value is not None]
+
+
+def _resolve_lookups(cursor, cards, lookups):
+    """
+    Fills the lookup caches with an id for every value the rows use.
+    One SELECT per table plus one multi-row INSERT for whatever is missing,
+    so _card_values never has to go back to the database.
+
+    Args:
+        cursor: Database cursor
+        cards: CardRecords to be loaded
+        lookups (dict): Caches from _new_lookup_caches(), filled in place
+    """
+    wanted = {table: set() for table in lookups if table != "BTs"}
+    wanted_bts = set()
+
+    for card in cards:
+        for table, value in _lookup_values(card):
+            wanted[table].add(value)
+        wanted_bts.add((card.bt_abbreviation, card.bt_name))
+
+    for table, values in wanted.items():
+        _load_lookup(cursor, table, lookups[table])
+        missing = sorted(value for value in values if value not in lookups[table])
+        if missing:
+            cursor.executemany(
+                f"INSERT INTO {table} (name) VALUES (%s) {_backend().lookup_upsert}",
+                [(value,) for value in missing],
+            )
+            _load_lookup(cursor, table, lookups[table])
+
+    _load_bts(cursor, lookups["BTs"])
+    missing_bts = sorted(
+        bt for bt in wanted_bts if f"{bt[0]}_{bt[1]}" not in lookups["BTs"]
+    )
+    if missing_bts:
+        cursor.executemany(
+            f"INSERT INTO BTs (abbreviation, name) VALUES (%s, %s) {_backend().lookup_upsert}",
+            missing_bts,
+        )
+        _load_bts(cursor, lookups["BTs"])
+
+
+def _load_lookup(cursor, table, cache):
+    """Reads a whole lookup table into a name -> id cache."""
+    cursor.execute(f"SELECT id, name FROM {table} ORDER BY id")
+    for lookup_id, name in cursor.fetchall():
+        cache.setdefault(name, lookup_id)
+
+
+def _load_bts(cursor, cache):
+    """Reads the BTs table into the abbreviation_name -> id cache."""
+    cursor.execute("SELECT id, abbreviation, name FROM BTs ORDER BY id")
+    for bt_id, abbreviation, name in cursor.fetchall():
+        cache.setdefault(f"{abbreviation}_{name}", bt_id)
+
+
+def _card_hash(card):
+    """
+    Fingerprint of a card, changes whenever any field does.
+    Taken over its CSV row, so hashes stored by older versions still match.
+    """
+    return hashlib.sha256("\x1f".join(card.to_csv_row()).encode("utf-8")).hexdigest()
+
+
+def _card_values(card, cursor, lookups):
+    """
+    Turns a card into the values for a Cards row, in _CARD_COLUMNS order.
+    Lookup table ids are resolved (and created if needed) on the way.
+
+    Args:
+        card (CardRecord): The card to store.
+        cursor: Database cursor
+        lookups (dict): Caches from _new_lookup_caches()
+    """
+
+    def lookup(table, value):
+        if value is None:
+            return None
+        return _get_id(lookups[table], value, cursor, table)
+
+    _insert_bt(cursor, card.bt_abbreviation, card.bt_name, lookups["BTs"])
+
+    return (
+        card.card_number,
+        card.name,
+        card.dp,
+        lookup("CardTypes", card.card_type),
+        lookup("Rarities", card.rarity),
+        lookup("Colors", card.color_one),
+        lookup("Colors", card.color_two),
+        lookup("Colors", card.color_three),
+        card.image_url,
+        card.cost,
+        lookup("Stages", card.stage),
+        lookup("Attributes", card.attribute),
+        lookup("Types", card.type_one),
+        lookup("Types", card.type_two),
+        card.evolution_cost_one,
+        card.evolution_cost_two,
+        card.effect,
+        card.evolution_effect,
+        card.security_effect,
+        lookups["BTs"][_bt_key(card)],
+        int(card.alternative),
+        card.level,
+        _card_hash(card),
+    )
+
+
+def _card_insert_sql():
+    columns = ", ".join(_CARD_COLUMNS)
+    placeholders = ", ".join(["%s"] * len(_CARD_COLUMNS))
+    return f"INSERT INTO Cards ({columns}) VALUES ({placeholders})"
+
+
+def _card_upsert_sql():
+    """INSERT for Cards that updates the row instead when card_number exists."""
+    upsert = _backend().upsert(("card_number",), _CARD_COLUMNS[1:])
+    return f"{_card_insert_sql()} {upsert}"
+
+
+def _load_fill_checkpoint():
+    """
+    Looks for a checkpoint left by an interrupted fill_db.
+
+    Returns:
+        tuple: Fingerprint of the current CSV, and the checkpoint if it
+        belongs to that same CSV (None otherwise).
+    """
+    csv_path = "temp/DigimonCards.csv"
+    if not os.path.exists(csv_path):
+        return None, None
+
+    sha = hashlib.sha256()
+    with open(csv_path, "rb") as csv_file:
+        for chunk in iter(lambda: csv_file.read(1024 * 1024), b""):
+            sha.update(chunk)
+    fingerprint = sha.hexdigest()
+
+    try:
+        with open(_FILL_CHECKPOINT, "r", encoding="utf-8") as file:
+            checkpoint = json.load(file)
+    except (OSError, ValueError):
+        return fingerprint, None
+
+    if checkpoint.get("csv") != fingerprint:
+        return fingerprint, None
+    return fingerprint, checkpoint
+
+
+def _write_fill_checkpoint(csv_fingerprint, **progress):
+    """
+    Records how far fill_db got: the last batch and row count for a
+    sequential load, or the finished BTs for a parallel one.
+    """
+    checkpoint = {"csv": csv_fingerprint, **progress}
+    atomic_write(_FILL_CHECKPOINT, json.dumps(checkpoint).encode("utf-8"))
+
+
+def _card_update_sql():
+    assignments = ", ".join(f"{column} = %s" for column in _CARD_COLUMNS[1:])
+    return f"UPDATE Cards SET {assignments} WHERE card_number = %s"
 
 
 def _get_id(dictionary, value, cursor, table):
@@ -707,7 +1634,9 @@ def _get_id(dictionary, value, cursor, table):
         if result:
             dictionary[value] = result[0]
         else:
-            cursor.execute(f"INSERT INTO {table} (name) VALUES (%s)", (value,))
+            cursor.execute(
+                f"INSERT INTO {table} (name) VALUES (%s) {_backend().lookup_upsert}", (value,)
+            )
             dictionary[value] = cursor.lastrowid
     return dictionary[value]
 
@@ -724,7 +1653,7 @@ def _insert_bt(cursor, abbreviation, name, bt_dict):
             bt_dict[key] = result[0]
         else:
             cursor.execute(
-                "INSERT INTO BTs (abbreviation, name) VALUES (%s, %s)",
+                f"INSERT INTO BTs (abbreviation, name) VALUES (%s, %s) {_backend().lookup_upsert}",
                 (abbreviation, name),
             )
             bt_dict[key] = cursor.lastrowid
@@ -736,15 +1665,26 @@ def _get_bts_from_server(cursor):
     return cursor.fetchall()
 
 
-def _list_BTs():
+@metrics.traced("list_bts")
+def _list_BTs(session=None, cache=None):
     """
     Website scraper - grabs the current list of BT sets available.
     Returns them in [url, name, abbreviation] format.
     """
-    url = "https://world.digimoncard.com/cardlist"
+    import requests
+    from bs4 import BeautifulSoup
+
+    url = _SITE_URL + "/cardlist"
     bt_list = []
 
-    response = requests.get(url)
+    http = session or requests
+    timeout = _env_float("HTTP_TIMEOUT", 30)
+    start = time.perf_counter()
+    if cache:
+        response = cache.get(http, url, timeout)
+    else:
+        response = http.get(url, timeout=timeout)
+    _record_response("cardlist", response, time.perf_counter() - start)
     if response.status_code == 200:
         soup = BeautifulSoup(response.text, "html.parser")
         nav_list = soup.find("div", {"id": "snaviList"})
@@ -752,7 +1692,7 @@ def _list_BTs():
 
         for link in links:
             title = link.find("span", {"class": "title"})
-            href = "https://world.digimoncard.com/cardlist/" + link.get("href")
+            href = _SITE_URL + "/cardlist/" + link.get("href")
             title_text = title.get_text().strip()
 
             match = re.search(r"\[(.*?)\]", title_text)
@@ -766,51 +1706,638 @@ def _list_BTs():
     return bt_list
 
 
-def _remove_csv_duplicates():
-    """Cleans up the CSV file - kicks out any duplicate card entries."""
-    unique_entries = []
+def _read_page_manifest():
+    try:
+        with open(_PAGE_MANIFEST, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _parser_fingerprint():
+    """Hash of the parser code, so a new parser never reuses old cards."""
+    import card_parser
+    import card_record
+
+    sha = hashlib.sha256()
+    for module in (card_parser, card_record):
+        with open(module.__file__, "rb") as file:
+            sha.update(file.read())
+    return sha.hexdigest()
+
+
+def _cached_page_cards(entry, fingerprint):
+    """
+    The cards parsed from a page last time.
+
+    Returns:
+        list: CardRecords, or None if the page changed or nothing is cached.
+    """
+    if not entry or any(entry.get(key) != value for key, value in fingerprint.items()):
+        return None
+    try:
+        with open(entry["rows"], "r", newline="", encoding="utf-8") as file:
+            return [CardRecord.from_csv_row(row) for row in csv.reader(file)]
+    except OSError:
+        return None
+
+
+def _store_page_cards(url, fingerprint, cards):
+    """
+    Keeps a page's parsed cards under temp/pages.
+
+    Returns:
+        dict: The page's manifest entry.
+    """
+    os.makedirs(_PAGE_CACHE, exist_ok=True)
+    path = os.path.join(
+        _PAGE_CACHE, hashlib.sha256(url.encode("utf-8")).hexdigest()[:16] + ".csv"
+    )
+    rows = io.StringIO()
+    csv.writer(rows).writerows(card.to_csv_row() for card in cards)
+    atomic_write(path, rows.getvalue().encode("utf-8"))
+    return dict(fingerprint, url=url, cards=len(cards), rows=path)
+
+
+def _process_pool(max_workers):
+    """
+    Process pool whose workers don't fork from this process.
+    The pools start their workers while fetch threads are mid-request, and a
+    child forked then can inherit a lock some other thread was holding and
+    hang on it. forkserver forks them from a clean single-threaded server
+    instead, spawn starts them from scratch where forkserver isn't there.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+def _create_session(pool_size=None):
+    """
+    Builds a requests Session that keeps connections alive between pages
+    and retries flaky responses with exponential backoff.
+
+    Args:
+        pool_size (int, optional): Connections kept open per host.
+        Defaults to FETCH_WORKERS from the environment.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    if pool_size is None:
+        pool_size = _env_int("FETCH_WORKERS", 8)
+
+    retry = Retry(
+        total=_env_int("HTTP_RETRIES", 3),
+        backoff_factor=_env_float("HTTP_BACKOFF", 0.5),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class _RateLimiter:
+    """
+    Spaces out requests to the same host, shared between worker threads.
+    A rate of 0 or None means no limit.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        if not self.interval:
+            return
+
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _fetch_pages(urls, session, max_workers=None, rate_limit=None, cache=None):
+    """
+    Downloads several pages at once through a shared session.
+
+    Args:
+        urls (list): Pages to grab.
+        session: requests Session to reuse connections from.
+        max_workers (int, optional): Concurrent downloads.
+        Defaults to FETCH_WORKERS from the environment.
+        rate_limit (float, optional): Max requests per second per host.
+        Defaults to FETCH_RATE_LIMIT from the environment.
+        cache (HttpCache, optional): Page cache to serve and revalidate from.
+
+    Returns:
+        iterator: One response per url, in the same order as urls.
+        None takes the place of pages that could not be downloaded.
+    """
+    import requests
+
+    if max_workers is None:
+        max_workers = _env_int("FETCH_WORKERS", 8)
+    if rate_limit is None:
+        rate_limit = _env_float("FETCH_RATE_LIMIT", 4)
+
+    limiter = _RateLimiter(rate_limit)
+    timeout = _env_float("HTTP_TIMEOUT", 30)
+
+    def fetch(url):
+        start = time.perf_counter()
+        try:
+            # Pages the cache serves from disk don't count against the limit
+            if cache:
+                response = cache.get(session, url, timeout, limiter)
+            else:
+                limiter.wait(url)
+                response = session.get(url, timeout=timeout)
+        except requests.RequestException as e:
+            _record_response("page", None, time.perf_counter() - start)
+            print(f"Failed to retrieve page {url}: {e}")
+            return None
+        _record_response("page", response, time.perf_counter() - start)
+        return response
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        yield from executor.map(fetch, urls)
+
+
+def _create_http_cache():
+    """
+    Sets up the on-disk page cache under temp/, unless HTTP_CACHE=0.
+
+    Returns:
+        HttpCache: The cache, or None when it is turned off.
+    """
+    if os.getenv("HTTP_CACHE", "1") == "0":
+        return None
+
+    return HttpCache(
+        os.getenv("HTTP_CACHE_DIR", os.path.join("temp", "http_cache")),
+        ttl=_env_float("HTTP_CACHE_TTL", 3600),
+        max_bytes=_env_int("HTTP_CACHE_MAX_MB", 200) * 1024 * 1024,
+    )
+
+
+def _record_response(kind, response, seconds):
+    """
+    Counts one HTTP request in the metrics: latency, status, bytes and the
+    retries urllib3 made along the way. response is None when it failed.
+    """
+    metrics.observe("http_request_seconds", seconds, kind=kind)
+    if response is None:
+        metrics.inc("http_requests_total", kind=kind, status="error")
+        return
+
+    if getattr(response, "from_cache", False):
+        metrics.inc("http_requests_total", kind=kind, status="cache")
+        return
+
+    metrics.inc("http_requests_total", kind=kind, status=response.status_code)
+    metrics.inc("http_bytes_total", len(response.content), kind=kind)
+    retries = getattr(getattr(response, "raw", None), "retries", None)
+    if retries is not None and retries.history:
+        metrics.inc("http_retries_total", len(retries.history), kind=kind)
+
+
+def _timed(function, *args):
+    """
+    Runs function and returns (result, seconds). Worker processes can't
+    record metrics of their own, so they hand the timing back this way.
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def _env_int(name, default):
+    """Reads an integer setting from the environment, or returns default."""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name, default):
+    """Reads a float setting from the environment, or returns default."""
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+class _DuplicateFilter:
+    """
+    Drops repeated card numbers while the CSV is being written.
+    Identical copies are always dropped, the policy decides what happens
+    when two copies of a card disagree:
+    - first: keep the first copy (rows stream straight to the CSV)
+    - last: keep the last copy, in the place of the first one
+    - merge: keep the first copy, filling its Null fields from later ones
+    """
+
+    POLICIES = ("first", "last", "merge")
+
+    def __init__(self, policy):
+        if policy not in self.POLICIES:
+            raise ValueError(
+                f"Unknown duplicate policy '{policy}', use one of {self.POLICIES}"
+            )
+        self.policy = policy
+        self.duplicates = 0
+        self.conflicts = 0
+        # first only needs a fingerprint per card, last and merge hold rows
+        self._seen = {}
+
+    def add(self, card):
+        """
+        Takes the next card.
+
+        Returns:
+            bool: True if the card can be written right away.
+        """
+        number = card.card_number
+        if number not in self._seen:
+            self._seen[number] = hash(card) if self.policy == "first" else card
+            return self.policy == "first"
+
+        self.duplicates += 1
+        kept = self._seen[number]
+
+        if self.policy == "first":
+            if kept != hash(card):
+                self.conflicts += 1
+        elif kept != card:
+            self.conflicts += 1
+            if self.policy == "last":
+                self._seen[number] = card
+            else:
+                self._seen[number] = dataclasses.replace(
+                    kept,
+                    **{
+                        field: getattr(card, field)
+                        for field in CARD_FIELDS
+                        if _is_null(getattr(kept, field))
+                        and not _is_null(getattr(card, field))
+                    },
+                )
+        return False
+
+    def held(self):
+        """Cards kept back by the last and merge policies, in first-seen order."""
+        if self.policy == "first":
+            return []
+        return list(self._seen.values())
+
+
+def _is_null(value):
+    return value is None or value == ""
+
 
-    with open("temp/DigimonCards.csv", "r+", newline="", encoding="utf-8") as csv_file:
-        reader = csv.DictReader(csv_file)
-        rows = list(reader)
-        csv_file.seek(0)
-        csv_file.truncate()
-        writer = csv.DictWriter(csv_file, fieldnames=reader.fieldnames)
-        writer.writeheader()
+def _image_urls(from_db=False):
+    """
+    Streams the (card_number, image_url) pairs download_images works on,
+    one row at a time so memory stays flat however big the catalogue is.
+
+    Args:
+        from_db (bool): Read from the Cards table instead of the CSV.
+
+    Returns:
+        tuple: Number of cards, and an iterator over the pairs.
+    """
+    if not from_db:
+        total = sum(1 for _ in _read_csv_cards())
+        return total, (
+            (card.card_number, card.image_url) for card in _read_csv_cards()
+        )
+
+    connection = _create_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM Cards")
+    total = cursor.fetchone()[0]
+
+    def rows():
+        try:
+            cursor.execute("SELECT card_number, image_url FROM Cards")
+            yield from cursor
+        finally:
+            cursor.close()
+            connection.close()
 
-        for row in rows:
-            card_number = row["card_number"]
-            if card_number not in unique_entries:
-                unique_entries.append(card_number)
-                writer.writerow(row)
+    return total, rows()
 
 
-def _download_convert_image(url, filename):
+def _download_image(session, url, filename, headers=None):
     """
-    Downloads card art and converts to WebP.
+    Downloads card art.
+
+    Args:
+        headers (dict, optional): Extra request headers, like the
+        conditional ones used to re-check an image.
+
+    Returns:
+        The response (200 or 304), or None if the download failed.
     """
+    import requests
+
+    start = time.perf_counter()
     try:
-        response = requests.get(url)
+        response = session.get(
+            url, headers=headers, timeout=_env_float("HTTP_TIMEOUT", 30)
+        )
+        _record_response("image", response, time.perf_counter() - start)
         response.raise_for_status()
+        return response
+    except requests.RequestException as e:
+        if e.response is None:
+            _record_response("image", None, time.perf_counter() - start)
+        print(f"Error downloading image {filename}: {str(e)}")
+        return None
+
 
-        png_path = os.path.join("img", f"{filename}.png")
-        with open(png_path, "wb") as f:
-            f.write(response.content)
+def _encode_webp(data, filename, source_sha, quality, method, widths=()):
+    """
+    Converts downloaded card art to WebP, runs inside a worker process.
+    The image is decoded once and every thumbnail is scaled from that.
+    Files land in the image store under the source hash. Everything is
+    done in memory and each WebP only shows up under its final name once
+    it is fully written, so an interrupted run never leaves a broken file.
 
-        img = Image.open(png_path).convert("RGBA")
-        webp_path = os.path.join("img", f"{filename}.webp")
-        img.save(webp_path, "WEBP")
+    Returns:
+        dict: Store details of every size, or None if it failed.
+    """
+    from PIL import Image
 
-        os.remove(png_path)
+    try:
+        img = Image.open(io.BytesIO(data)).convert("RGBA")
+
+        variants = {
+            "full": _save_webp(
+                img, os.path.join(_IMAGE_STORE, f"{source_sha}.webp"), quality, method
+            )
+        }
+
+        for width in widths:
+            # Never upscale, a small original is its own thumbnail
+            if width >= img.width:
+                variants[str(width)] = variants["full"]
+                continue
+            height = max(1, round(img.height * width / img.width))
+            thumbnail = img.resize((width, height), Image.LANCZOS)
+            variants[str(width)] = _save_webp(
+                thumbnail,
+                os.path.join(_IMAGE_STORE, f"{source_sha}_{width}.webp"),
+                quality,
+                method,
+            )
+
+        return variants
     except Exception as e:
         print(f"Error processing image {filename}: {str(e)}")
+        return None
 
 
-if __name__ == "__main__":
-    create_csv()
-    create_db_structure()
-    fill_db()
-    # update_db()
-    # download_images()
-    # import_collection_from_json("digimon-card-collector (1).json")
+def _save_webp(img, path, quality, method):
+    """Encodes one WebP into the store and returns its manifest details."""
+    webp = io.BytesIO()
+    img.save(webp, "WEBP", quality=quality, method=method)
+    content = webp.getbuffer()
+    atomic_write(path, content)
+    return {
+        "object": path.replace(os.sep, "/"),
+        "width": img.width,
+        "height": img.height,
+        "bytes": len(content),
+        "sha256": hashlib.sha256(content).hexdigest(),
+    }
+
+
+def _image_stored(entry, sizes):
+    """True if a manifest entry has every size and its store files exist."""
+    if "source" not in entry:
+        return False
+    return all(
+        size in entry and os.path.exists(entry[size]["object"]) for size in sizes
+    )
+
+
+def _link_card_images(card_number, source, variants):
+    """
+    Points the per-card image files at the store.
+
+    Returns:
+        dict: Manifest entry for the card.
+    """
+    entry = {"source": source}
+    for size, variant in variants.items():
+        if size == "source":
+            continue
+        if size == "full":
+            path = f"img/{card_number}.webp"
+        else:
+            path = f"img/{size}/{card_number}.webp"
+        _link_file(variant["object"], path)
+        entry[size] = dict(variant, path=path)
+    return entry
+
+
+def _link_file(target, path):
+    """Hard links path to target, or copies it where links aren't possible."""
+    if os.path.exists(path) and os.path.samefile(target, path):
+        return
+
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(target, temp_path)
+    except OSError:
+        shutil.copyfile(target, temp_path)
+    os.replace(temp_path, path)
+
+
+def _read_image_manifest():
+    """The image manifest written by the last download_images run, if any."""
+    try:
+        with open(_IMAGE_MANIFEST, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def main(argv=None):
+    """
+    Command line entry point, one subcommand per pipeline stage.
+    Running without a subcommand does a full build: scrape, schema, load.
+    """
+    global _storage
+
+    parser = argparse.ArgumentParser(description="Digimon Card Database Creator")
+    parser.add_argument(
+        "--sqlite",
+        metavar="PATH",
+        help="Use this SQLite file instead of the MySQL server",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        default=os.getenv("METRICS_FILE"),
+        help="Write stage metrics here, Prometheus text for .prom, else JSON",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", help="Log every card written"
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    scrape = commands.add_parser("scrape", help="Write temp/DigimonCards.csv")
+    scrape.add_argument("--workers", type=int, help="Pages downloaded at once")
+    scrape.add_argument("--parse-workers", type=int, help="Parsing processes")
+    scrape.add_argument(
+        "--duplicates",
+        choices=_DuplicateFilter.POLICIES,
+        help="Which copy wins when a card is listed twice with different data",
+    )
+    scrape.add_argument(
+        "--reparse", action="store_true", help="Parse unchanged pages again too"
+    )
+
+    commands.add_parser("schema", help="Create or upgrade the database tables")
+
+    load = commands.add_parser("load", help="Load the CSV into the database")
+    load.add_argument("--batch-size", type=int, help="Cards per insert and commit")
+    load.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore the checkpoint of an interrupted load",
+    )
+    load.add_argument(
+        "--workers", type=int, help="Connections loading BTs in parallel"
+    )
+    load.add_argument(
+        "--reload", action="store_true", help="Load unchanged BTs again too"
+    )
+
+    commands.add_parser("update", help="Scrape and load BTs not in the database")
+
+    sync = commands.add_parser("sync", help="Sync the database card by card")
+    sync.add_argument(
+        "--prune",
+        action="store_true",
+        help="Delete cards the website no longer lists",
+    )
+
+    images = commands.add_parser("images", help="Download and convert card images")
+    images.add_argument("--refresh", action="store_true", help="Re-check every image")
+    images.add_argument(
+        "--from-db", action="store_true", help="Read cards from the database"
+    )
+    images.add_argument("--fetch-workers", type=int, help="Concurrent downloads")
+    images.add_argument("--encode-workers", type=int, help="Encoding processes")
+
+    export = commands.add_parser(
+        "export", help="Write the CSV as typed Parquet or Arrow (needs pyarrow)"
+    )
+    export.add_argument("--format", choices=("parquet", "arrow"), default="parquet")
+    export.add_argument("--output", help="File to write, next to the CSV by default")
+
+    collection = commands.add_parser(
+        "import-collection", help="Import a digimoncard.app collection JSON"
+    )
+    collection.add_argument("json_path")
+    collection.add_argument(
+        "--user", help="Whose collection it is, added if new (default user if left out)"
+    )
+
+    missing = commands.add_parser("missing", help="Cards of a BT not in a collection")
+    missing.add_argument("bt", help="BT abbreviation, like BT-01")
+    missing.add_argument("--user", help="Whose collection (default user if left out)")
+
+    commands.add_parser("build", help="scrape, schema and load in one go")
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        format="%(message)s",
+        level=logging.DEBUG if args.verbose else os.getenv("LOG_LEVEL", "INFO").upper(),
+    )
+
+    if args.sqlite:
+        _storage = SQLiteBackend(args.sqlite)
+
+    try:
+        _run_command(args)
+    finally:
+        if args.metrics:
+            metrics.write(args.metrics)
+
     print("All operations completed")
+
+
+def _run_command(args):
+    """Runs the stage main() parsed from the command line."""
+    if args.command == "scrape":
+        create_csv(
+            max_workers=args.workers,
+            parse_workers=args.parse_workers,
+            duplicates=args.duplicates,
+            reparse=args.reparse,
+        )
+    elif args.command == "schema":
+        create_db_structure()
+    elif args.command == "load":
+        fill_db(
+            batch_size=args.batch_size,
+            resume=not args.restart,
+            workers=args.workers,
+            reload=args.reload,
+        )
+    elif args.command == "update":
+        update_db()
+    elif args.command == "sync":
+        sync_db(prune=args.prune)
+    elif args.command == "images":
+        download_images(
+            fetch_workers=args.fetch_workers,
+            encode_workers=args.encode_workers,
+            refresh=args.refresh,
+            from_db=args.from_db,
+        )
+    elif args.command == "export":
+        from catalogue_export import export_catalogue
+
+        export_catalogue(output_path=args.output, format=args.format)
+    elif args.command == "import-collection":
+        user_id = DEFAULT_USER_ID
+        if args.user:
+            user_id = get_user_id(args.user, create=True)
+        if user_id is not None:
+            import_collection_from_json(args.json_path, user_id)
+    elif args.command == "missing":
+        user_id = DEFAULT_USER_ID
+        if args.user:
+            user_id = get_user_id(args.user)
+        if user_id is None:
+            print(f"No user called {args.user}.")
+        else:
+            cards = missing_cards(args.bt, user_id)
+            for card_number in cards:
+                print(card_number)
+            print(f"{len(cards)} cards of {args.bt} missing")
+    else:
+        create_csv()
+        create_db_structure()
+        fill_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Parser benchmark: card_parser against the original BeautifulSoup walk.
+Run from the project root with `python benchmarks/bench_parser.py`.
+"""
+
+# Standard library imports
+import os
+import re
+import sys
+import time
+import glob
+
+# Third party imports
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Local imports
+from card_parser import parse_page
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def legacy_parse_page(html, bt_name, bt_abbreviation):
+    """The card loop create_csv used before card_parser, kept for comparison."""
+    soup = BeautifulSoup(html, "lxml")
+
+    if not soup.find("ul", class_="image_lists"):
+        return None
+
+    cards = []
+    card_items = soup.find_all(
+        "li", class_=re.compile(r"image_lists_item data page-\d+")
+    )
+
+    for card_item in card_items:
+        alternative = card_item.find("li", class_="cardtype cardParallel")
+
+        popup_div = card_item.find("div", class_="popup")
+        first_div = popup_div.find("div")
+        colors = first_div.get("class")
+
+        img_div = card_item.find("img")
+        raw_image_url = img_div.get("src")
+        image_url = "https://world.digimoncard.com" + raw_image_url[2:]
+
+        card_head = card_item.find("ul", class_="cardinfo_head")
+        head_elements = [element.text.strip() for element in card_head.find_all("li")]
+
+        rarity = head_elements[1]
+        card_type = head_elements[2]
+        name = card_item.find("div", class_="card_name").get_text()
+
+        if alternative is None:
+            card_number = head_elements[0]
+            alternative = 0
+        else:
+            raw_card_number = raw_image_url.split("/")[-1]
+            raw_card_number = raw_card_number.split(".")[0]
+            card_number = raw_card_number
+            alternative = 1
+
+        dd_elements = card_item.find_all("dd")
+
+        colors = dd_elements[0].text.strip()
+        stage = dd_elements[1].text.strip()
+        attribute = dd_elements[2].text.strip()
+        types = dd_elements[3].text.strip()
+        dp = dd_elements[4].text.strip()
+        cost = dd_elements[5].text.strip()
+        effect = dd_elements[8].text.strip()
+        evolution_effect = dd_elements[9].text.strip()
+        security_effect = dd_elements[10].text.strip()
+        evolution_cost_one = dd_elements[6].text.strip()
+        evolution_cost_two = dd_elements[7].text.strip()
+
+        if types == "-":
+            type_one = "Null"
+            type_two = "Null"
+        else:
+            if "/" in types:
+                type_one, type_two = types.split("/", 1)
+            else:
+                type_one = types
+                type_two = "Null"
+
+        if card_type == "Digimon" and len(head_elements) >= 4:
+            level = head_elements[3]
+        else:
+            level = "Null"
+
+        if stage == "-":
+            stage = "Null"
+        if dp == "-":
+            dp = "Null"
+        if attribute == "-":
+            attribute = "Null"
+        if cost == "-":
+            cost = "Null"
+
+        if evolution_cost_one in ("-", ""):
+            evolution_cost_one = "Null"
+        else:
+            evolution_cost_one = re.search(r"\d+", evolution_cost_one).group()
+
+        if evolution_cost_two in ("-", ""):
+            evolution_cost_two = "Null"
+        else:
+            evolution_cost_two = re.search(r"\d+", evolution_cost_two).group()
+
+        if effect == "-":
+            effect = "Null"
+        if evolution_effect == "-":
+            evolution_effect = "Null"
+        if security_effect == "-":
+            security_effect = "Null"
+
+        color_list = colors.split()
+        color_one = color_list[0]
+        color_two = color_list[1] if len(color_list) > 1 else "NULL"
+        color_three = color_list[2] if len(color_list) > 2 else "NULL"
+
+        cards.append(
+            [
+                card_number,
+                name,
+                card_type,
+                rarity,
+                color_one,
+                color_two,
+                color_three,
+                image_url,
+                cost,
+                stage,
+                attribute,
+                type_one,
+                type_two,
+                evolution_cost_one,
+                evolution_cost_two,
+                effect,
+                evolution_effect,
+                security_effect,
+                bt_abbreviation,
+                bt_name,
+                dp,
+                alternative,
+                level,
+            ]
+        )
+
+    return cards
+
+
+def _time_per_card(parser, html, rounds):
+    """Best-of-rounds parse time for one page, divided by its card count."""
+    best = None
+    cards = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        cards = len(parser(html, "Benchmark", "BENCH"))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / max(cards, 1), cards
+
+
+def main(rounds=20):
+    pages = sorted(glob.glob(os.path.join(FIXTURES, "bt*.html")))
+    if not pages:
+        print(f"No BT fixtures found in {FIXTURES}")
+        return
+
+    for page in pages:
+        with open(page, "r", encoding="utf-8") as file:
+            html = file.read()
+
+        legacy = legacy_parse_page(html, "Benchmark", "BENCH")
+        current = parse_page(html, "Benchmark", "BENCH")
+        legacy_rows = [[str(value) for value in card] for card in legacy]
+        if [card.to_csv_row() for card in current] != legacy_rows:
+            print(f"{os.path.basename(page)}: parsers disagree, skipping timing")
+            continue
+
+        legacy_time, cards = _time_per_card(legacy_parse_page, html, rounds)
+        current_time, _ = _time_per_card(parse_page, html, rounds)
+
+        print(
+            f"{os.path.basename(page)}: {cards} cards | "
+            f"legacy {legacy_time * 1e6:.1f} us/card | "
+            f"card_parser {current_time * 1e6:.1f} us/card | "
+            f"{legacy_time / current_time:.1f}x faster"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Pipeline benchmark: scrape, load and image stages without the live site or MySQL.
+Run from the project root with `python benchmarks/bench_pipeline.py`.
+
+The saved card list and BT pages, plus a few sample images, are served by
+a local HTTP server standing in for the Digimon site, and the database is
+a throwaway SQLite file. Results are saved as JSON, pass an older results
+file to --compare to see what got faster or slower.
+"""
+
+# Standard library imports
+import os
+import io
+import sys
+import glob
+import json
+import time
+import zlib
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+sys.path.insert(0, ROOT)
+
+# Categories linked from fixtures/cardlist.html
+PAGES = {"522001": "bt01.html", "522002": "bt02.html", "522101": "st01.html"}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Answers the requests the scraper makes, from the fixtures folder."""
+
+    files = {}
+    images = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+
+        if url.path.rstrip("/") == "/cardlist":
+            category = parse_qs(url.query).get("category", [None])[0]
+            name = "cardlist.html" if category is None else PAGES.get(category)
+            if name in self.files:
+                return self._send(self.files[name], "text/html; charset=utf-8")
+
+        elif url.path.startswith("/images/") and self.images:
+            card = os.path.basename(url.path).encode("utf-8")
+            image = self.images[zlib.crc32(card) % len(self.images)]
+            # Decoders stop at the end of the PNG, the trailing card number
+            # only makes every download unique so none of them are deduped
+            return self._send(image + card, "image/png")
+
+        self.send_error(404)
+
+    def _send(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_site():
+    """Starts the stand-in site on a free local port, returns its base URL."""
+    for name in ["cardlist.html", *PAGES.values()]:
+        with open(os.path.join(FIXTURES, name), "rb") as file:
+            FixtureHandler.files[name] = file.read()
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "images", "*.png"))):
+        with open(path, "rb") as file:
+            FixtureHandler.images.append(file.read())
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+@contextlib.contextmanager
+def quiet():
+    """Keeps per-card output and progress bars out of the timings."""
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(
+        io.StringIO()
+    ):
+        yield
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    with quiet():
+        function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def bench_parse():
+    """Parsing alone, in this process: cards per second over the BT pages."""
+    from card_parser import parse_page
+
+    pages = [FixtureHandler.files[name].decode("utf-8") for name in PAGES.values()]
+    start = time.perf_counter()
+    cards = sum(len(parse_page(page, "Benchmark", "BENCH")) for page in pages)
+    return cards, time.perf_counter() - start
+
+
+def bench_dedup(Main, repeat=20):
+    """The duplicate filter create_csv runs every card through."""
+    from card_parser import parse_page
+
+    cards = []
+    for name in PAGES.values():
+        cards += parse_page(FixtureHandler.files[name].decode("utf-8"), "B", "B")
+    cards *= repeat
+
+    start = time.perf_counter()
+    duplicate_filter = Main._DuplicateFilter("first")
+    for card in cards:
+        duplicate_filter.add(card)
+    return len(cards), time.perf_counter() - start
+
+
+def bench_scrape(Main):
+    """create_csv end to end: list BTs, fetch, parse, dedupe, write the CSV."""
+    elapsed = timed(Main.create_csv, rate_limit=0)
+    with open("temp/DigimonCards.csv", encoding="utf-8") as file:
+        cards = sum(1 for _ in file) - 1
+    return cards, elapsed
+
+
+def bench_load(Main):
+    """fill_db into a fresh SQLite file, schema creation not counted."""
+    with quiet():
+        Main.create_db_structure()
+    elapsed = timed(Main.fill_db, resume=False)
+    with open("temp/DigimonCards.csv", encoding="utf-8") as file:
+        rows = sum(1 for _ in file) - 1
+    return rows, elapsed
+
+
+def bench_images(Main):
+    """download_images from the stand-in site, WebP and thumbnails included."""
+    elapsed = timed(Main.download_images)
+    with open(Main._IMAGE_MANIFEST, encoding="utf-8") as file:
+        images = len(json.load(file))
+    return images, elapsed
+
+
+# Stage -> (benchmark, unit the throughput is counted in)
+STAGES = {
+    "parse": (bench_parse, "cards"),
+    "dedup": (bench_dedup, "cards"),
+    "scrape": (bench_scrape, "cards"),
+    "load": (bench_load, "rows"),
+    "images": (bench_images, "images"),
+}
+
+
+def run(stages, rounds):
+    site = start_site()
+
+    # Read by Main at import time, the .env can't override these
+    os.environ["DIGIMON_SITE_URL"] = site
+    os.environ["HTTP_CACHE"] = "0"
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join("temp", "benchmark.db")
+
+    import Main
+
+    results = {}
+    for name in stages:
+        benchmark, unit = STAGES[name]
+        best = None
+        for _ in range(rounds):
+            # Every round starts from an empty working folder
+            with tempfile.TemporaryDirectory() as workdir:
+                os.chdir(workdir)
+                try:
+                    if name in ("load", "images"):
+                        with quiet():
+                            Main.create_csv(rate_limit=0)
+                    args = () if benchmark is bench_parse else (Main,)
+                    count, elapsed = benchmark(*args)
+                finally:
+                    os.chdir(ROOT)
+            best = elapsed if best is None else min(best, elapsed)
+
+        results[name] = {
+            unit: count,
+            "seconds": round(best, 4),
+            f"{unit}_per_sec": round(count / best, 1),
+        }
+        print(f"{name}: {count} {unit} in {best:.3f} s, {count / best:,.1f} {unit}/s")
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, old_path):
+    """Prints the throughput change of every stage against an older run."""
+    with open(old_path, "r", encoding="utf-8") as file:
+        old = json.load(file)
+
+    print(f"\nAgainst {os.path.basename(old_path)} ({old.get('commit')}):")
+    for name, stage in results["stages"].items():
+        old_stage = old.get("stages", {}).get(name)
+        if not old_stage:
+            continue
+        for key, value in stage.items():
+            if key.endswith("_per_sec") and old_stage.get(key):
+                change = (value / old_stage[key] - 1) * 100
+                print(
+                    f"  {name}: {old_stage[key]:,.1f} -> {value:,.1f} {key} ({change:+.1f}%)"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--stages", nargs="+", choices=STAGES, default=list(STAGES), metavar="STAGE"
+    )
+    parser.add_argument("--rounds", type=int, default=3, help="Best of this many runs")
+    parser.add_argument(
+        "--output", help="Results file, under benchmarks/results by default"
+    )
+    parser.add_argument(
+        "--compare", metavar="RESULTS", help="Older results to compare with"
+    )
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "rounds": args.rounds,
+        "stages": run(args.stages, args.rounds),
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS, f"pipeline-{stamp}-{commit or 'nogit'}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Startup benchmark: how long the CLI takes before doing any work.
+Run from the project root with `python benchmarks/bench_startup.py`.
+tests/test_startup.py checks that no heavy library is imported to show --help.
+"""
+
+# Standard library imports
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(args):
+    """
+    Runs Main.py under -X importtime.
+
+    Returns:
+        dict: Top-level package -> total self import time in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "Main.py", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        times[package] = times.get(package, 0) + int(self_time)
+    return times
+
+
+def main(rounds=5):
+    runs = [import_times(["--help"]) for _ in range(rounds)]
+    best = min(sum(run.values()) for run in runs)
+    print(f"Main.py --help imports: {best / 1000:.1f} ms (best of {rounds})")
+
+    # Slowest first, to see what to make lazy next
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)[:5]
+    for name, self_time in slowest:
+        print(f"  {name}: {self_time / 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Card page parser for the Digimon Card Database Creator
+Author: Deckoner
+"""
+
+# Third party imports
+from lxml import etree, html
+
+# Local imports
+from card_record import CardRecord, int_or_none
+
+
+def _has_class(name):
+    """XPath predicate matching elements that carry the given class."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Compiled once at import time and reused for every card on every page
+_CARD_LIST = etree.XPath(f"//ul[{_has_class('image_lists')}]")
+_CARD_ITEMS = etree.XPath(
+    r"//li[re:test(normalize-space(@class), 'image_lists_item data page-\d+')]",
+    namespaces={"re": "http://exslt.org/regular-expressions"},
+)
+_IS_PARALLEL = etree.XPath("boolean(.//li[@class='cardtype cardParallel'])")
+_IMAGE_SRC = etree.XPath("string((.//img)[1]/@src)")
+_HEAD_ITEMS = etree.XPath(f"(.//ul[{_has_class('cardinfo_head')}])[1]//li")
+_CARD_NAME = etree.XPath(f"string((.//div[{_has_class('card_name')}])[1])")
+_DETAILS = etree.XPath(".//dd")
+
+SITE_URL = "https://world.digimoncard.com"
+
+
+def parse_page(page_html, bt_name, bt_abbreviation, site_url=SITE_URL):
+    """
+    Pulls every card out of a BT page.
+
+    Args:
+        page_html (str): Raw HTML of the BT page.
+        bt_name (str): BT title the cards belong to.
+        bt_abbreviation (str): Short BT code, like BT01.
+        site_url (str): Site the page came from, image URLs are built on it.
+
+    Returns:
+        list: One CardRecord per card, or None if the page has no card list.
+    """
+    document = html.document_fromstring(page_html)
+
+    if not _CARD_LIST(document):
+        return None
+
+    return [
+        parse_card(card_item, bt_name, bt_abbreviation, site_url)
+        for card_item in _CARD_ITEMS(document)
+    ]
+
+
+def parse_card(element, bt_name, bt_abbreviation, site_url=SITE_URL):
+    """
+    Turns a single card <li> into a CardRecord.
+
+    Args:
+        element: lxml element for the card's <li class="image_lists_item">.
+        bt_name (str): BT title the card belongs to.
+        bt_abbreviation (str): Short BT code, like BT01.
+        site_url (str): Site the card came from, the image URL is built on it.
+
+    Returns:
+        CardRecord: The card, with None for whatever the site leaves as "-".
+    """
+    raw_image_url = _IMAGE_SRC(element)
+    image_url = site_url + raw_image_url[2:]
+
+    head_elements = [item.text_content().strip() for item in _HEAD_ITEMS(element)]
+    rarity = head_elements[1]
+    card_type = head_elements[2]
+    name = _CARD_NAME(element)
+
+    # This part handles alternative art card versions
+    if _IS_PARALLEL(element):
+        # Special case for alternative art get number from image URL
+        card_number = raw_image_url.split("/")[-1].split(".")[0]
+        alternative = True
+    else:
+        card_number = head_elements[0]
+        alternative = False
+
+    details = [dd.text_content().strip() for dd in _DETAILS(element)]
+    (
+        colors,
+        stage,
+        attribute,
+        types,
+        dp,
+        cost,
+        evolution_cost_one,
+        evolution_cost_two,
+        effect,
+        evolution_effect,
+        security_effect,
+    ) = details[:11]
+
+    if types == "-":
+        type_one = None
+        type_two = None
+    elif "/" in types:
+        type_one, type_two = types.split("/", 1)
+    else:
+        type_one = types
+        type_two = None
+
+    if card_type == "Digimon" and len(head_elements) >= 4:
+        level = int_or_none(head_elements[3])
+    else:
+        level = None
+
+    color_list = colors.split()
+    color_one = color_list[0]
+    color_two = color_list[1] if len(color_list) > 1 else None
+    color_three = color_list[2] if len(color_list) > 2 else None
+
+    return CardRecord(
+        card_number=card_number,
+        name=name,
+        card_type=card_type,
+        rarity=rarity,
+        color_one=color_one,
+        color_two=color_two,
+        color_three=color_three,
+        image_url=image_url,
+        cost=int_or_none(cost),
+        stage=_null_if_dash(stage),
+        attribute=_null_if_dash(attribute),
+        type_one=type_one,
+        type_two=type_two,
+        evolution_cost_one=int_or_none(evolution_cost_one),
+        evolution_cost_two=int_or_none(evolution_cost_two),
+        effect=_null_if_dash(effect),
+        evolution_effect=_null_if_dash(evolution_effect),
+        security_effect=_null_if_dash(security_effect),
+        bt_abbreviation=bt_abbreviation,
+        bt_name=bt_name,
+        dp=int_or_none(dp),
+        alternative=alternative,
+        level=level,
+    )
+
+
+def _null_if_dash(value):
+    """The site uses "-" for empty fields."""
+    return None if value == "-" else value
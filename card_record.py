@@ -0,0 +1,96 @@
+"""
+The card record shared by every stage of the Digimon Card Database Creator
+Author: Deckoner
+"""
+
+# Standard library imports
+import re
+from dataclasses import dataclass, fields
+from typing import Optional
+
+_DIGITS = re.compile(r"\d+")
+
+
+@dataclass(slots=True, frozen=True)
+class CardRecord:
+    """
+    One card, typed: numbers are ints and missing values are None.
+    The CSV keeps its old spelling ("Null", "NULL" for the extra colors,
+    "Lv.3" for levels), to_csv_row and from_csv_row translate.
+    """
+
+    card_number: str
+    name: str
+    card_type: str
+    rarity: str
+    color_one: str
+    color_two: Optional[str]
+    color_three: Optional[str]
+    image_url: str
+    cost: Optional[int]
+    stage: Optional[str]
+    attribute: Optional[str]
+    type_one: Optional[str]
+    type_two: Optional[str]
+    evolution_cost_one: Optional[int]
+    evolution_cost_two: Optional[int]
+    effect: Optional[str]
+    evolution_effect: Optional[str]
+    security_effect: Optional[str]
+    bt_abbreviation: str
+    bt_name: str
+    dp: Optional[int]
+    alternative: bool
+    level: Optional[int]
+
+    def to_csv_row(self):
+        """The card as CSV text, in CARD_FIELDS order."""
+        row = []
+        for field in CARD_FIELDS:
+            value = getattr(self, field)
+            if value is None:
+                row.append(_CSV_NULLS.get(field, "Null"))
+            elif field == "level":
+                row.append(f"Lv.{value}")
+            elif field == "alternative":
+                row.append("1" if value else "0")
+            else:
+                row.append(str(value))
+        return row
+
+    @classmethod
+    def from_csv_row(cls, row):
+        """Reads back a row written by to_csv_row."""
+        values = dict(zip(CARD_FIELDS, row))
+        for field in _INT_FIELDS:
+            values[field] = int_or_none(values[field])
+        for field in _OPTIONAL_TEXT_FIELDS:
+            if values[field].lower() == "null":
+                values[field] = None
+        values["alternative"] = values["alternative"] == "1"
+        return cls(**values)
+
+
+# CSV column order
+CARD_FIELDS = tuple(field.name for field in fields(CardRecord))
+
+_INT_FIELDS = ("cost", "evolution_cost_one", "evolution_cost_two", "dp", "level")
+_OPTIONAL_TEXT_FIELDS = (
+    "color_two",
+    "color_three",
+    "stage",
+    "attribute",
+    "type_one",
+    "type_two",
+    "effect",
+    "evolution_effect",
+    "security_effect",
+)
+# The CSV has always spelled the empty extra colors in capitals
+_CSV_NULLS = {"color_two": "NULL", "color_three": "NULL"}
+
+
+def int_or_none(value):
+    """The first number in values like "5000" or "Lv.3", None if there's none."""
+    match = _DIGITS.search(value)
+    return int(match.group()) if match else None
@@ -0,0 +1,135 @@
+"""
+Columnar export of the card catalogue for the Digimon Card Database Creator
+Author: Deckoner
+
+pyarrow is optional, only this export needs it: pip install pyarrow
+"""
+
+# Standard library imports
+import os
+import csv
+
+# Local imports
+from card_record import CARD_FIELDS, CardRecord
+
+FORMATS = ("parquet", "arrow")
+
+_INT_COLUMNS = ("cost", "evolution_cost_one", "evolution_cost_two", "dp", "level")
+_DICTIONARY_COLUMNS = (
+    "card_type",
+    "rarity",
+    "color_one",
+    "color_two",
+    "color_three",
+    "stage",
+    "attribute",
+    "type_one",
+    "type_two",
+    "bt_abbreviation",
+    "bt_name",
+)
+
+
+def export_catalogue(
+    csv_path="temp/DigimonCards.csv", output_path=None, format="parquet"
+):
+    """
+    Writes the scraped CSV as a typed columnar file.
+    - "Null" / "NULL" become real nulls
+    - dp, cost, level and evolution costs are integers, alternative a bool
+    - Colors, types, rarities and the other repeated names are dictionary encoded
+    - Both formats can be memory-mapped, see open_catalogue
+
+    Args:
+        csv_path (str): CSV written by create_csv.
+        output_path (str, optional): Where to write. Defaults to the CSV path
+        with a .parquet or .arrow extension.
+        format (str): "parquet" (zstd compressed, smallest) or "arrow"
+        (uncompressed Arrow IPC, zero-copy when memory-mapped).
+
+    Returns:
+        str: The file written, or None if pyarrow is missing.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        print("The export needs pyarrow, install it with: pip install pyarrow")
+        return None
+
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format {format!r}, use one of {FORMATS}")
+    if output_path is None:
+        output_path = os.path.splitext(csv_path)[0] + "." + format
+
+    columns = {name: [] for name in CARD_FIELDS}
+    with open(csv_path, mode="r", encoding="utf-8") as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader)
+        for row in reader:
+            card = CardRecord.from_csv_row(row)
+            for name, values in columns.items():
+                values.append(getattr(card, name))
+
+    arrays = [_column_array(pa, name, values) for name, values in columns.items()]
+    table = pa.Table.from_arrays(arrays, names=list(columns))
+
+    # Written next to the target first, so readers never map half a file
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        if format == "parquet":
+            import pyarrow.parquet as pq
+
+            pq.write_table(
+                table,
+                temp_path,
+                compression="zstd",
+                use_dictionary=list(_DICTIONARY_COLUMNS),
+                row_group_size=10000,
+            )
+        else:
+            from pyarrow import feather
+
+            feather.write_feather(
+                table, temp_path, compression="uncompressed", chunksize=10000
+            )
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    print(f"Exported {table.num_rows} cards to {output_path}")
+    return output_path
+
+
+def open_catalogue(path, columns=None):
+    """
+    Memory-maps an exported catalogue instead of reading it into memory.
+    Only the requested columns are touched.
+
+    Args:
+        path (str): File written by export_catalogue.
+        columns (list, optional): Column names to load, all of them if None.
+
+    Returns:
+        pyarrow.Table: The cards.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(path, columns=columns, memory_map=True)
+
+    from pyarrow import feather
+
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def _column_array(pa, name, values):
+    """Arrow array for one CardRecord field."""
+    if name == "alternative":
+        return pa.array(values, type=pa.bool_())
+    if name in _INT_COLUMNS:
+        return pa.array(values, type=pa.int32())
+    if name in _DICTIONARY_COLUMNS:
+        return pa.array(values, type=pa.string()).dictionary_encode()
+    return pa.array(values, type=pa.string())
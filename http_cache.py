@@ -0,0 +1,175 @@
+"""
+On-disk HTTP cache for the Digimon Card Database Creator
+Author: Deckoner
+"""
+
+# Standard library imports
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+class CachedResponse:
+    """Just enough of a requests Response to stand in for a cached page."""
+
+    def __init__(self, url, content, encoding, headers):
+        self.url = url
+        self.status_code = 200
+        self.content = content
+        self.encoding = encoding
+        self.headers = headers
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class HttpCache:
+    """
+    Keeps page bodies under a folder, keyed by URL, and revalidates them
+    with If-None-Match / If-Modified-Since once they get older than ttl.
+
+    Args:
+        directory (str): Where bodies and their metadata are stored.
+        ttl (float): Seconds a cached page is trusted without asking the server.
+        max_bytes (int): Total body size kept before the least recently
+        used pages are evicted.
+    """
+
+    def __init__(self, directory, ttl, max_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def get(self, session, url, timeout=None, limiter=None):
+        """
+        GETs a URL through the cache.
+        limiter, if given, is waited on before every request that actually
+        goes out, never for pages served straight from disk.
+
+        Returns:
+            A requests Response for fresh downloads and errors, or a
+            CachedResponse when the stored body is still good.
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        meta = self._read_meta(key)
+
+        if meta and time.time() - meta["stored_at"] < self.ttl:
+            cached = self._load(key, meta)
+            if cached is not None:
+                return cached
+
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        if limiter:
+            limiter.wait(url)
+        response = session.get(url, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and meta:
+            cached = self._load(key, meta)
+            if cached is not None:
+                meta["stored_at"] = time.time()
+                self._write_meta(key, meta)
+                return cached
+            # Body went missing, ask again without validators
+            if limiter:
+                limiter.wait(url)
+            response = session.get(url, timeout=timeout)
+
+        if response.status_code == 200:
+            self._store(key, url, response)
+
+        return response
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".body", base + ".json"
+
+    def _read_meta(self, key):
+        _, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, meta):
+        _, meta_path = self._paths(key)
+        atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def _load(self, key, meta):
+        body_path, _ = self._paths(key)
+        try:
+            with open(body_path, "rb") as file:
+                content = file.read()
+            # Touching the body keeps it at the young end of the LRU
+            os.utime(body_path)
+        except OSError:
+            return None
+        return CachedResponse(
+            meta["url"], content, meta.get("encoding"), meta.get("headers", {})
+        )
+
+    def _store(self, key, url, response):
+        body_path, _ = self._paths(key)
+        atomic_write(body_path, response.content)
+        self._write_meta(
+            key,
+            {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "encoding": response.encoding or response.apparent_encoding,
+                "headers": {
+                    "Content-Type": response.headers.get("Content-Type", "")
+                },
+                "stored_at": time.time(),
+            },
+        )
+        self._evict()
+
+    def _evict(self):
+        """Drops least recently used pages until the cache fits max_bytes."""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".body"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+            entries.sort()
+            for _, size, body_path in entries:
+                if total <= self.max_bytes:
+                    break
+                for path in (body_path, body_path[: -len(".body")] + ".json"):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+
+def atomic_write(path, data):
+    """Writes to a temp file first so readers never see half a file."""
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,119 @@
+"""
+Streaming JSON reading for the Digimon Card Database Creator
+Author: Deckoner
+
+ijson is optional: when it's installed it does the parsing, otherwise a
+small reader built on the json module walks the file a chunk at a time.
+"""
+
+# Standard library imports
+import json
+
+# Everything that can follow the first digit of a JSON number
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+
+def iter_list(path, key):
+    """
+    Yields the items of one list in a JSON object, like data[key],
+    without ever holding the whole file in memory.
+
+    Args:
+        path (str): JSON file whose top level is an object.
+        key (str): Name of the list inside it.
+    """
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    if ijson is not None:
+        with open(path, "rb") as file:
+            yield from ijson.items(file, f"{key}.item")
+        return
+
+    with open(path, "r", encoding="utf-8") as file:
+        reader = _Reader(file)
+        reader.expect("{")
+        while reader.peek() != "}":
+            name = reader.value()
+            reader.expect(":")
+            if name == key and reader.peek() == "[":
+                reader.expect("[")
+                while reader.peek() != "]":
+                    yield reader.value()
+                    reader.skip(",")
+                reader.expect("]")
+            else:
+                reader.value()
+            reader.skip(",")
+
+
+class _Reader:
+    """Just enough of an incremental JSON parser to walk one big list."""
+
+    def __init__(self, file, chunk_size=1 << 16):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+
+    def _fill(self):
+        """Reads the next chunk, dropping what was already parsed."""
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """The next character that isn't whitespace."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of the JSON file")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in the JSON file")
+        self._pos += 1
+
+    def skip(self, char):
+        if self.peek() == char:
+            self._pos += 1
+
+    def value(self):
+        """The next complete JSON value."""
+        first = self.peek()
+        if first == "-" or first.isdigit():
+            self._read_number()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # Cut off by the end of the chunk
+                if not self._fill():
+                    raise
+                continue
+            self._pos = end
+            return value
+
+    def _read_number(self):
+        """
+        Reads on until the number at the cursor is whole. raw_decode happily
+        takes the 1 of a 1.5 cut after the dot, so a number only counts as
+        complete once something that can't be part of it follows.
+        """
+        end = self._pos
+        while True:
+            while end < len(self._buffer) and self._buffer[end] in _NUMBER_CHARS:
+                end += 1
+            scanned = end - self._pos
+            if end < len(self._buffer) or not self._fill():
+                return
+            end = self._pos + scanned
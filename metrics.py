@@ -0,0 +1,261 @@
+"""
+Metrics and tracing for the Digimon Card Database Creator
+Author: Deckoner
+
+Every stage records into the shared `metrics` registry: counters, latency
+histograms and one span per stage. At the end of a run it is written as
+JSON, or in the Prometheus text format for node_exporter's textfile collector.
+"""
+
+# Standard library imports
+import json
+import time
+import bisect
+import functools
+import threading
+import contextlib
+
+# Local imports
+from http_cache import atomic_write
+
+# Histogram bucket upper bounds in seconds, from a cache hit to a slow page
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metrics:
+    """
+    Counters, histograms and stage spans, safe to record from any thread.
+    Names follow the Prometheus habits: counters end in _total, latency
+    histograms in _seconds. Labels are passed as keyword arguments.
+
+    Args:
+        namespace (str): Prefix for every name in the Prometheus output.
+        buckets (tuple): Histogram bucket upper bounds, in seconds.
+    """
+
+    def __init__(self, namespace="digimon", buckets=BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters = {}
+        self._histograms = {}
+        self._spans = []
+
+    def inc(self, name, value=1, **labels):
+        """Adds value to a counter."""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """Records one duration in a histogram."""
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+                self._histograms[key] = histogram
+            histogram["counts"][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram["sum"] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Times the with block into a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """
+        Traces a pipeline stage: when it ran, for how long, whether it
+        failed, and which stage it ran inside of. The duration also goes
+        into the stage_seconds histogram.
+        """
+        stack = self._local.__dict__.setdefault("stack", [])
+        parent = stack[-1] if stack else None
+        stack.append(name)
+
+        started_at = time.time()
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            with self._lock:
+                self._spans.append(
+                    {
+                        "name": name,
+                        "parent": parent,
+                        "started_at": started_at,
+                        "seconds": seconds,
+                        "status": status,
+                    }
+                )
+            self.observe("stage_seconds", seconds, stage=name)
+
+    def traced(self, name):
+        """Decorator running the whole function inside span(name)."""
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def instrument(self, connection):
+        """
+        Wraps a database connection so every query counts as a round trip
+        in db_round_trips_total and is timed in db_query_seconds.
+        """
+        if connection is None:
+            return None
+        return _InstrumentedConnection(connection, self)
+
+    def snapshot(self):
+        """Everything recorded so far, as plain JSON-ready data."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = []
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                buckets = {}
+                for bound, count in zip(
+                    [*map(str, self.buckets), "+Inf"], histogram["counts"]
+                ):
+                    cumulative += count
+                    buckets[bound] = cumulative
+                histograms.append(
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "buckets": buckets,
+                        "sum": histogram["sum"],
+                        "count": cumulative,
+                    }
+                )
+            spans = list(self._spans)
+        return {"counters": counters, "histograms": histograms, "spans": spans}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """The Prometheus text exposition format, spans left out."""
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for counter in snapshot["counters"]:
+            name = f"{self.namespace}_{counter['name']}"
+            declare(name, "counter")
+            lines.append(f"{name}{_labels(counter['labels'])} {counter['value']}")
+
+        for histogram in snapshot["histograms"]:
+            name = f"{self.namespace}_{histogram['name']}"
+            declare(name, "histogram")
+            for bound, count in histogram["buckets"].items():
+                labels = _labels(dict(histogram["labels"], le=bound))
+                lines.append(f"{name}_bucket{labels} {count}")
+            labels = _labels(histogram["labels"])
+            lines.append(f"{name}_sum{labels} {histogram['sum']}")
+            lines.append(f"{name}_count{labels} {histogram['count']}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Saves the metrics, as Prometheus text for .prom files, else JSON."""
+        if path.endswith(".prom"):
+            content = self.to_prometheus()
+        else:
+            content = self.to_json()
+        atomic_write(path, content.encode("utf-8"))
+
+
+def _key(name, labels):
+    # Label values are text, like in Prometheus. An int status next to a
+    # "cache" one would otherwise break the sorting in snapshot().
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _statement(sql):
+    """SELECT, INSERT, UPDATE... the kind of query, for the labels."""
+    words = sql.split(None, 1)
+    return words[0].upper() if words else "?"
+
+
+class _InstrumentedConnection:
+    def __init__(self, connection, metrics):
+        self._connection = connection
+        self._metrics = metrics
+
+    def cursor(self, *args, **kwargs):
+        return _InstrumentedCursor(
+            self._connection.cursor(*args, **kwargs), self._metrics
+        )
+
+    def commit(self):
+        self._metrics.inc("db_round_trips_total", statement="COMMIT")
+        self._connection.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class _InstrumentedCursor:
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def execute(self, sql, *args, **kwargs):
+        statement = _statement(sql)
+        self._metrics.inc("db_round_trips_total", statement=statement)
+        with self._metrics.timer("db_query_seconds", statement=statement):
+            return self._cursor.execute(sql, *args, **kwargs)
+
+    def executemany(self, sql, seq_of_params, *args, **kwargs):
+        # Counted as one trip, the MySQL driver batches inserts into one statement
+        statement = _statement(sql)
+        self._metrics.inc("db_round_trips_total", statement=statement)
+        with self._metrics.timer("db_query_seconds", statement=statement):
+            return self._cursor.executemany(sql, seq_of_params, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+# Shared by every stage in the process
+metrics = Metrics()
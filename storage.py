@@ -0,0 +1,356 @@
+"""
+Storage backends for the Digimon Card Database Creator
+Author: Deckoner
+
+Main.py writes its queries once, with MySQL's %s placeholders. A backend
+hands out connections that understand them and covers the few statements
+where MySQL and SQLite disagree (upserts, schema checks, full-text search).
+"""
+
+# Standard library imports
+import os
+import time
+import threading
+
+
+class MySQLBackend:
+    """
+    The MySQL server from the .env, through one pool shared by every stage.
+
+    Args:
+        pool_size (int): Connections kept open, clamped to 1..32.
+        pool_timeout (float): Seconds to wait for a free connection.
+    """
+
+    name = "mysql"
+    auto_id = "INT AUTO_INCREMENT PRIMARY KEY"
+    # Hands back the existing id as lastrowid when the name is already there
+    lookup_upsert = "ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)"
+    # InnoDB always stores rows in primary key order
+    clustered = ""
+    # TEMPORARY keeps it from dropping a real table or committing
+    drop_temporary = "DROP TEMPORARY TABLE IF EXISTS {}"
+
+    def __init__(self, pool_size=5, pool_timeout=30):
+        from mysql.connector.pooling import CNX_POOL_MAXSIZE
+
+        if not 1 <= pool_size <= CNX_POOL_MAXSIZE:
+            clamped = max(1, min(pool_size, CNX_POOL_MAXSIZE))
+            print(f"DB_POOL_SIZE must be 1 to {CNX_POOL_MAXSIZE}, using {clamped}")
+            pool_size = clamped
+        self.pool_size = pool_size
+        self.pool_timeout = pool_timeout
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def max_writers(self):
+        return self.pool_size
+
+    def connect(self):
+        """
+        Connecting to the database, through the shared pool.
+        Closing the connection hands it back to the pool for the next stage.
+        The pool pings a connection before handing it out and reconnects it if
+        the server dropped it, so callers always get a healthy one.
+        Returns:
+            connection: MySQL hookup or None if something's broken
+        """
+        from mysql.connector import Error
+        from mysql.connector.errors import PoolError
+
+        try:
+            pool = self._get_pool()
+            deadline = time.monotonic() + self.pool_timeout
+            while True:
+                try:
+                    return pool.get_connection()
+                except PoolError:
+                    # Every connection is checked out, wait for one to come back
+                    if time.monotonic() >= deadline:
+                        raise
+                    time.sleep(0.05)
+        except Error as e:
+            print(f"MySQL connection error: {e}")
+            return None
+
+    def _get_pool(self):
+        """The MySQL connection pool, opened the first time it's needed."""
+        from mysql.connector import pooling
+
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name="digimon_cards",
+                    pool_size=self.pool_size,
+                    host=os.getenv("DB_HOST"),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD"),
+                    database=os.getenv("DB_NAME"),
+                )
+            return self._pool
+
+    def create_database(self):
+        """
+        Checks if the database exists and creates it if not.
+        """
+        import mysql.connector
+        from mysql.connector import Error
+
+        db_name = os.getenv("DB_NAME")
+        if not db_name:
+            print("Error: DB_NAME is not defined in environment variables.")
+            return
+
+        try:
+            # Connect without specifying database
+            connection = mysql.connector.connect(
+                host=os.getenv("DB_HOST"),
+                user=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASSWORD"),
+            )
+            cursor = connection.cursor()
+
+            # Check database existence
+            cursor.execute(
+                "SELECT SCHEMA_NAME FROM INFORMATION_SCHEMA.SCHEMATA WHERE SCHEMA_NAME = %s",
+                (db_name,),
+            )
+            if not cursor.fetchone():
+                cursor.execute(f"CREATE DATABASE {db_name}")
+                print(f"Database '{db_name}' created successfully.")
+
+            cursor.close()
+            connection.close()
+
+        except Error as e:
+            print(f"Database creation error: {e}")
+
+    def upsert(self, key, columns):
+        """INSERT suffix that updates columns when key already exists."""
+        updates = ", ".join(f"{column} = VALUES({column})" for column in columns)
+        return f"ON DUPLICATE KEY UPDATE {updates}"
+
+    def has_column(self, cursor, table, column):
+        cursor.execute(
+            """
+            SELECT 1 FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+            """,
+            (table, column),
+        )
+        return cursor.fetchone() is not None
+
+    def has_index(self, cursor, table, index_name):
+        cursor.execute(
+            """
+            SELECT 1 FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+            LIMIT 1
+            """,
+            (table, index_name),
+        )
+        return cursor.fetchone() is not None
+
+    def create_index(self, cursor, table, index_name, columns, kind="INDEX"):
+        cursor.execute(f"CREATE {kind} {index_name} ON {table} ({columns})")
+
+    def merge_duplicates(self, cursor, table, key, references):
+        """
+        Keeps the oldest row of every duplicated key in a lookup table,
+        moving the rows that point at a duplicate over to it first.
+        """
+        join = " AND ".join(f"k.{part} = d.{part}" for part in key.split(", "))
+
+        for referencing_table, column in references:
+            cursor.execute(
+                f"""
+                UPDATE {referencing_table} r
+                JOIN {table} d ON d.id = r.{column}
+                JOIN (SELECT {key}, MIN(id) AS id FROM {table} GROUP BY {key}) k
+                    ON {join}
+                SET r.{column} = k.id
+                WHERE r.{column} <> k.id
+                """
+            )
+
+        cursor.execute(
+            f"DELETE d FROM {table} d JOIN {table} k ON {join} AND k.id < d.id"
+        )
+
+    def is_retryable(self, error):
+        """Deadlocks (1213) and lock wait timeouts (1205) are worth a retry."""
+        return getattr(error, "errno", None) in (1205, 1213)
+
+
+class SQLiteBackend:
+    """
+    A single SQLite file in WAL mode, no server needed.
+    Readers never block the writer, but there is only ever one writer.
+
+    Args:
+        path (str): Database file, created on first use.
+        busy_timeout (float): Seconds to wait for another writer to finish.
+    """
+
+    name = "sqlite"
+    auto_id = "INTEGER PRIMARY KEY AUTOINCREMENT"
+    lookup_upsert = "ON CONFLICT DO NOTHING"
+    # Rows stored in the primary key's b-tree, like InnoDB, so lookups by
+    # the key don't need a second trip to the table
+    clustered = "WITHOUT ROWID"
+    drop_temporary = "DROP TABLE IF EXISTS temp.{}"
+    max_writers = 1
+
+    def __init__(self, path, busy_timeout=30):
+        self.path = path
+        self.busy_timeout = busy_timeout
+
+    def connect(self):
+        """
+        Opens the database file.
+        Returns:
+            connection: SQLite hookup or None if something's broken
+        """
+        import sqlite3
+
+        try:
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode = WAL")
+            # Safe with WAL, only the last commits can be lost on power failure
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA foreign_keys = ON")
+        except sqlite3.Error as e:
+            print(f"SQLite connection error: {e}")
+            return None
+        return _SQLiteConnection(connection)
+
+    def create_database(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def upsert(self, key, columns):
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns)
+        return f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}"
+
+    def has_column(self, cursor, table, column):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cursor.fetchall())
+
+    def has_index(self, cursor, table, index_name):
+        # A FULLTEXT index is an FTS5 table of its own, so its tbl_name is
+        # its own name rather than table's
+        cursor.execute(
+            """
+            SELECT 1 FROM sqlite_master
+            WHERE name = %s AND (tbl_name = %s OR type = 'table')
+            """,
+            (index_name, table),
+        )
+        return cursor.fetchone() is not None
+
+    def create_index(self, cursor, table, index_name, columns, kind="INDEX"):
+        if kind != "FULLTEXT INDEX":
+            cursor.execute(f"CREATE {kind} {index_name} ON {table} ({columns})")
+            return
+
+        # FTS5 table over the same columns, kept in step by triggers
+        names = [column.strip() for column in columns.split(",")]
+        new = ", ".join(f"new.{column}" for column in names)
+        old = ", ".join(f"old.{column}" for column in names)
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {index_name} USING fts5("
+            f"{columns}, content='{table}', content_rowid='id')"
+        )
+        delete = (
+            f"INSERT INTO {index_name} ({index_name}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old});"
+        )
+        insert = f"INSERT INTO {index_name} (rowid, {columns}) VALUES (new.id, {new});"
+        for event, body in (
+            ("INSERT", insert),
+            ("DELETE", delete),
+            ("UPDATE", delete + " " + insert),
+        ):
+            cursor.execute(
+                f"CREATE TRIGGER {index_name}_{event.lower()} AFTER {event} "
+                f"ON {table} BEGIN {body} END"
+            )
+        cursor.execute(f"INSERT INTO {index_name} ({index_name}) VALUES ('rebuild')")
+
+    def merge_duplicates(self, cursor, table, key, references):
+        """Same as MySQLBackend.merge_duplicates, without multi-table UPDATE."""
+        join = " AND ".join(f"k.{part} = d.{part}" for part in key.split(", "))
+
+        for referencing_table, column in references:
+            cursor.execute(
+                f"""
+                UPDATE {referencing_table}
+                SET {column} = (
+                    SELECT MIN(k.id) FROM {table} d JOIN {table} k ON {join}
+                    WHERE d.id = {referencing_table}.{column}
+                )
+                WHERE {column} IN (SELECT id FROM {table})
+                """
+            )
+
+        cursor.execute(
+            f"DELETE FROM {table} WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM {table} GROUP BY {key})"
+        )
+
+    def is_retryable(self, error):
+        return False
+
+
+class _SQLiteConnection:
+    """sqlite3 connection whose cursors take %s placeholders."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self):
+        return _SQLiteCursor(self._connection.cursor())
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+
+class _SQLiteCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql.replace("%s", "?"), params)
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(sql.replace("%s", "?"), seq_of_params)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
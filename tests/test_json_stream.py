@@ -0,0 +1,60 @@
+"""
+The fallback reader of json_stream against json.load, at every chunk size
+Run from the project root with `python -m pytest tests`
+"""
+
+# Standard library imports
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Local imports
+import json_stream
+
+DOCUMENT = {
+    "version": 1.5,
+    "exported": -2.25e-3,
+    "note": 'Quotes " and brackets ]} in a string',
+    "meta": {"flags": [True, False, None], "nested": {"collection": [0]}},
+    "collection": [
+        {"id": "BT1-001", "count": 3},
+        {"id": "BT1-001_P1", "count": 12},
+        {"id": "ST1-03", "count": 0.5e2},
+        {"id": "BT2-010", "count": -1},
+        [1, 2.0, 3e10],
+        "loose",
+        1234567890,
+        7.25,
+    ],
+    "total": 1e-7,
+}
+
+
+def test_fallback_matches_json_load(tmp_path, monkeypatch):
+    # Leaves the fallback reader in charge even where ijson is installed
+    monkeypatch.setitem(sys.modules, "ijson", None)
+
+    path = tmp_path / "collection.json"
+    for text in (json.dumps(DOCUMENT), json.dumps(DOCUMENT, indent=4)):
+        path.write_text(text, encoding="utf-8")
+        with open(path, encoding="utf-8") as file:
+            expected = json.load(file)["collection"]
+
+        for chunk_size in range(1, len(text) + 2):
+            monkeypatch.setattr(
+                json_stream._Reader.__init__, "__defaults__", (chunk_size,)
+            )
+            items = list(json_stream.iter_list(str(path), "collection"))
+            assert items == expected, f"chunk size {chunk_size}"
+
+
+def test_float_cut_after_the_dot(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "ijson", None)
+
+    path = tmp_path / "collection.json"
+    path.write_text('{"a": 1.5, "collection": [2.5e3]}', encoding="utf-8")
+    for chunk_size in (1, 2, 3, 4, 5, 6, 7, 8):
+        monkeypatch.setattr(json_stream._Reader.__init__, "__defaults__", (chunk_size,))
+        assert list(json_stream.iter_list(str(path), "collection")) == [2500.0]
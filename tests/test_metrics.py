@@ -0,0 +1,42 @@
+"""
+The metrics registry, written out the way the --metrics option writes it
+Run from the project root with `python -m pytest tests`
+"""
+
+# Standard library imports
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Local imports
+from metrics import Metrics
+
+
+def test_mixed_status_labels():
+    # A revalidated page, cached pages and a failed download in one run
+    metrics = Metrics()
+    metrics.inc("http_requests_total", kind="page", status=200)
+    metrics.inc("http_requests_total", kind="page", status="cache")
+    metrics.inc("http_requests_total", kind="page", status="cache")
+    metrics.inc("http_requests_total", kind="image", status="error")
+    metrics.observe("http_request_seconds", 0.2, kind="page", status=304)
+    metrics.observe("http_request_seconds", 0.001, kind="page", status="cache")
+
+    counters = json.loads(metrics.to_json())["counters"]
+    assert {
+        "name": "http_requests_total",
+        "labels": {"kind": "page", "status": "cache"},
+        "value": 2,
+    } in counters
+    assert {
+        "name": "http_requests_total",
+        "labels": {"kind": "page", "status": "200"},
+        "value": 1,
+    } in counters
+
+    text = metrics.to_prometheus()
+    assert 'digimon_http_requests_total{kind="page",status="200"} 1' in text
+    assert 'digimon_http_requests_total{kind="page",status="cache"} 2' in text
+    assert 'digimon_http_request_seconds_count{kind="page",status="304"} 1' in text
@@ -0,0 +1,34 @@
+"""
+Startup imports: showing --help must not pull in the heavy libraries
+Run from the project root with `python -m pytest tests`
+"""
+
+# Standard library imports
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only the commands that need these should import them
+HEAVY_MODULES = ("requests", "bs4", "lxml", "PIL", "tqdm", "mysql", "pandas", "pyarrow")
+
+
+def test_help_imports_no_heavy_modules():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "Main.py", "--help"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    imported = set()
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "self [us]" not in line:
+            name = line.rsplit("|", 1)[1].strip()
+            imported.add(name.split(".")[0])
+
+    # Main.py itself imports dotenv first thing, so the output was read
+    assert "dotenv" in imported
+    assert not imported & set(HEAVY_MODULES), "imported at startup but should be lazy"